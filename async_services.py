@@ -0,0 +1,124 @@
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:  # optional, SimpleTex falls back to a worker thread without it
+    aiohttp = None
+
+from cache import ResultCache, resultCache
+from metrics import metrics
+from ocr_services import OCRClient, RateLimitedService, SimpleTex, readImageBytes, registry
+from ratelimit import limiters, retryDelay
+
+
+class AsyncRecognitionService:
+    async def recognizeFormula(self, image_data):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class ThreadedService(AsyncRecognitionService):
+    """ Run a blocking SDK service on the default executor so the event loop keeps going """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def recognizeFormula(self, image_data):
+        return await asyncio.to_thread(self.service.recognizeFormula, image_data)
+
+
+class AsyncSimpleTex(AsyncRecognitionService):
+    """ SimpleTex over aiohttp, signing and response parsing are shared with `SimpleTex` """
+
+    def __init__(self, service: SimpleTex, provider='API.SIMPLETEX', maxConnections=32, retries=3):
+        self.service = service
+        self.provider = provider
+        self.maxConnections = maxConnections
+        self.retries = retries
+        self.session = None
+
+    def getSession(self):
+        # created lazily because the session must belong to the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.maxConnections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def recognizeFormula(self, image_data):
+        if isinstance(image_data, str):
+            filename, image_bytes = image_data, await asyncio.to_thread(readImageBytes, image_data)
+        elif isinstance(image_data, bytes):
+            filename, image_bytes = "image.png", image_data
+        else:
+            raise ValueError("Unsupported image data type")
+
+        # same quota and backoff as `RateLimitedService`, waiting on the loop instead of a thread
+        for attempt in range(self.retries + 1):
+            limiter = limiters.get(self.provider)
+            await asyncio.sleep(limiter.reserve())
+            result = await self.post(filename, image_bytes)
+            if result.get('status') or not result.get('retryable') or attempt == self.retries:
+                return result
+            delay = retryDelay(attempt, result.get('retryAfter'))
+            if delay is None:
+                return result
+            limiter.drain()
+            await asyncio.sleep(delay)
+
+    async def post(self, filename, image_bytes):
+        form = aiohttp.FormData()
+        form.add_field("file", image_bytes, filename=filename, content_type="image/png")
+        with metrics.timer("sign", self.service.name):
+            headers = self.service.generateHeaders()
+        try:
+            with metrics.timer("network", self.service.name):
+                async with self.getSession().post(self.service.api_url, data=form, headers=headers) as response:
+                    result = await response.json(content_type=None) if response.status == 200 else None
+            with metrics.timer("parse", self.service.name):
+                return SimpleTex.parseResponse(response.status, result, response.headers.get("Retry-After"))
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            return {"status": False, "message": str(e) or type(e).__name__, "retryable": True}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncOCRClient:
+    """ `OCRClient` for asyncio callers, many recognitions in flight on a single event loop """
+
+    def __init__(self, service, cache=resultCache, fallbacks=(), **kwargs):
+        self.service = service
+        self.cache = cache
+        self.client = self._get_client_instance(service, fallbacks, **kwargs)
+
+    @staticmethod
+    def _get_client_instance(service, fallbacks, **kwargs):
+        if fallbacks:
+            # the router hedges on its own threads, it does not need a second event-loop implementation
+            return ThreadedService(OCRClient(service, cache=None, fallbacks=fallbacks, **kwargs).client)
+        client = registry.get(service, **kwargs)
+        if isinstance(client, SimpleTex) and aiohttp is not None:
+            return AsyncSimpleTex(client, service)
+        return ThreadedService(RateLimitedService(client, service))
+
+    async def recognizeText(self, image_data):
+        if self.cache is None:
+            return OCRClient.toText(await self.client.recognizeFormula(image_data))
+
+        if isinstance(image_data, str):
+            image_data = await asyncio.to_thread(readImageBytes, image_data)
+        key = ResultCache.makeKey(image_data, self.service)
+        # a miss in memory reads the disk tier, which must not stall the event loop
+        result = await asyncio.to_thread(self.cache.get, key)
+        if result is None:
+            result = await self.client.recognizeFormula(image_data)
+            if result.get('status'):
+                key = ResultCache.makeKey(image_data, result.get('service', self.service))
+                await asyncio.to_thread(self.cache.put, key, result)
+        return OCRClient.toText(result)
+
+    async def close(self):
+        await self.client.close()
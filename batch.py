@@ -0,0 +1,55 @@
+import csv
+import glob
+import os
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def isImageFile(path):
+    return os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def collectImages(paths):
+    """ expand files, folders and glob patterns into a sorted, de-duplicated list of image paths """
+    images = []
+    seen = set()
+
+    def add(path):
+        path = os.path.normpath(path)
+        if path not in seen and isImageFile(path):
+            seen.add(path)
+            images.append(path)
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()  # walk subfolders in name order too, not in whatever order the file system lists them
+                for name in sorted(files):
+                    add(os.path.join(root, name))
+        elif glob.has_magic(path):
+            for match in sorted(glob.glob(path, recursive=True)):
+                add(match)
+        else:
+            add(path)
+    return images
+
+
+def exportTex(entries, path):
+    """ write `(image path, latex)` pairs as one .tex file, one display formula per image """
+    with open(path, 'w', encoding='utf-8') as f:
+        for image, latex in entries:
+            f.write(f"% {image}\n\\[\n{latex}\n\\]\n\n")
+
+
+def exportCsv(entries, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "latex"])
+        writer.writerows(entries)
+
+
+def exportResults(entries, path):
+    if path.lower().endswith('.csv'):
+        exportCsv(entries, path)
+    else:
+        exportTex(entries, path)
@@ -0,0 +1,233 @@
+""" Benchmark the provider clients offline: `python benchmark.py --provider all --latency 80 --jitter 30`
+
+    The real `SimpleTex`, `Tencent` and `AliYun` code talks to a local stand-in server that answers
+    with each provider's request and response shapes, so no API quota or network access is needed.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+from cli import SERVICES, positiveInt
+from ocr_services import OCRClient, registry
+from ratelimit import limiters
+from server import percentile
+
+MOCK_LATEX = r"\int_{0}^{1} x^{2} \, d x = \frac{1}{3}"
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """ Answer like SimpleTex, Tencent Cloud or Aliyun, telling them apart by path and headers """
+
+    server_version = "FormuliteMock"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            with self.server.lock:
+                self.send(200, dict(self.server.counters))
+        else:
+            self.send(404, {"message": "Not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.server.lock:
+            self.server.counters["requests"] += 1
+            self.server.counters["bytes"] += len(body)
+
+        latency, jitter = self.server.latency, self.server.jitter
+        time.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+        failed = random.random() < self.server.errorRate
+
+        if self.path.startswith("/api/latex_ocr"):
+            self.simpleTex(failed)
+        elif self.headers.get("X-TC-Action"):
+            self.tencent(failed)
+        elif self.headers.get("x-acs-action") or "Action" in parse_qs(urlparse(self.path).query):
+            self.aliyun(failed)
+        else:
+            self.send(404, {"message": "Unknown provider request"})
+
+    def simpleTex(self, failed):
+        if failed:
+            self.send(429, {"status": False, "message": "Too many requests"})
+        else:
+            self.send(200, {"status": True, "res": {"latex": MOCK_LATEX, "conf": 0.98},
+                            "request_id": uuid.uuid4().hex})
+
+    def tencent(self, failed):
+        # Tencent Cloud reports errors in a 200 response
+        response = {"RequestId": str(uuid.uuid4())}
+        if failed:
+            response["Error"] = {"Code": "RequestLimitExceeded", "Message": "Your current request times equals to "
+                                 "`limit` in a second, please retry later."}
+        else:
+            response["FormulaInfos"] = [{"DetectedText": MOCK_LATEX, "ItemPolygon": {"X": 8, "Y": 8,
+                                                                                    "Width": 460, "Height": 80}}]
+        self.send(200, {"Response": response})
+
+    def aliyun(self, failed):
+        if failed:
+            self.send(400, {"Code": "Throttling.User", "Message": "Request was denied due to user flow control.",
+                            "RequestId": str(uuid.uuid4())})
+        else:
+            self.send(200, {"RequestId": str(uuid.uuid4()),
+                            "Data": json.dumps({"content": MOCK_LATEX, "height": 96, "width": 480})})
+
+    def send(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serveMock(port, latency, jitter, errorRate, ready=None):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockProviderHandler)
+    server.daemon_threads = True
+    server.latency, server.jitter, server.errorRate = latency, jitter, errorRate
+    server.lock = threading.Lock()
+    server.counters = {"requests": 0, "bytes": 0}
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def startMock(latency, jitter, errorRate):
+    """ run the mock in its own process so its work does not count as client CPU time """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serveMock, args=(0, latency, jitter, errorRate, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=10)
+
+
+def mockCounters(port):
+    with urlopen(f"http://127.0.0.1:{port}/__stats") as response:
+        return json.load(response)
+
+
+def syntheticPng(width=480, height=96, seed=0):
+    """ a grayscale PNG with sparse dark strokes, about the size of a cropped formula """
+    rng = random.Random(seed)
+    rows = bytearray()
+    for _ in range(height):
+        rows.append(0)
+        rows.extend(0 if rng.random() < 0.06 else 255 for _ in range(width))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(bytes(rows), 9)) + chunk(b"IEND", b""))
+
+
+def runMode(ocr_client, image, requests, concurrency, port):
+    def recognizeOnce(_):
+        start = time.perf_counter()
+        try:
+            status = ocr_client.recognizeText(image)["status"]
+        except Exception:
+            status = False
+        return status, time.perf_counter() - start
+
+    before = mockCounters(port)
+    cpu, start = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(recognizeOnce, range(requests)))
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+    after = mockCounters(port)
+
+    latencies = [latency for _, latency in outcomes]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "failed": sum(1 for status, _ in outcomes if not status),
+        "throughput": requests / wall,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "uploaded": after["bytes"] - before["bytes"],
+        "attempts": after["requests"] - before["requests"],
+        "cpu": cpu,
+    }
+
+
+def milliseconds(seconds, width):
+    """ a latency column, a dash when there were no samples to take a percentile of """
+    return f"{'-':>{width}}" if seconds is None else f"{seconds * 1000:>{width}.1f}"
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR provider clients against a local mock server.")
+    parser.add_argument("-p", "--provider", choices=sorted(SERVICES) + ["all"], default="all")
+    parser.add_argument("-n", "--requests", type=positiveInt, default=50, help="requests per mode (default: 50)")
+    parser.add_argument("-j", "--concurrency", type=positiveInt, default=16,
+                        help="workers in the concurrent mode (default: 16)")
+    parser.add_argument("--latency", type=float, default=50, help="mock server latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=10, help="latency spread in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with throttling")
+    parser.add_argument("--quota", action="store_true", help="keep to the providers' default request quotas")
+    parser.add_argument("--image", help="image to upload instead of a synthetic formula")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON lines")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="only run the mock server on PORT")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    if args.serve is not None:
+        print(f"Mock provider server listening on http://127.0.0.1:{args.serve}")
+        serveMock(args.serve, args.latency / 1000, args.jitter / 1000, args.error_rate)
+        return 0
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = f.read()
+    else:
+        image = syntheticPng()
+
+    process, port = startMock(args.latency / 1000, args.jitter / 1000, args.error_rate)
+    # single: one request at a time, batch: the GUI executor's four workers, concurrent: --concurrency
+    modes = [("single", 1), ("batch", 4), ("concurrent", args.concurrency)]
+    providers = sorted(SERVICES) if args.provider == "all" else [args.provider]
+    try:
+        if not args.json:
+            print(f"{'provider':<14}{'mode':<12}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                  f"{'failed':>8}{'KiB up':>9}{'CPU ms/req':>12}")
+        for provider in providers:
+            service = SERVICES[provider]
+            if not args.quota:
+                limiters.configure(service, 1e9)
+            ocr_client = OCRClient(service, cache=None, id="benchmark", key="benchmark",
+                                   endpoint=f"127.0.0.1:{port}", scheme="http")
+            for mode, concurrency in modes:
+                report = runMode(ocr_client, image, args.requests, concurrency, port)
+                if args.json:
+                    print(json.dumps(dict(provider=provider, mode=mode, **report)), flush=True)
+                else:
+                    print(f"{provider:<14}{mode:<12}{report['throughput']:>8.1f}{milliseconds(report['p50'], 9)}"
+                          f"{milliseconds(report['p95'], 9)}{milliseconds(report['p99'], 9)}{report['failed']:>8}"
+                          f"{report['uploaded'] / 1024:>9.1f}{report['cpu'] * 1000 / report['requests']:>12.2f}",
+                          flush=True)
+    finally:
+        registry.clear()
+        process.terminate()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
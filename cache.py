@@ -0,0 +1,206 @@
+import copy
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# chunks that affect the decoded pixels, everything else (tEXt, tIME, pHYs...) is metadata
+PNG_PIXEL_CHUNKS = {b'IHDR', b'PLTE', b'tRNS', b'IDAT', b'IEND'}
+
+# next to the application rather than the working directory, so every entry point shares one store
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource', 'cache')
+
+
+def normalizeImageBytes(image_bytes):
+    """ drop PNG metadata chunks so re-saved copies of the same picture hash alike """
+    if not image_bytes.startswith(PNG_SIGNATURE):
+        return image_bytes
+
+    parts = [PNG_SIGNATURE]
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(image_bytes):
+        length, chunkType = struct.unpack('>I4s', image_bytes[offset:offset + 8])
+        end = offset + 12 + length
+        if chunkType in PNG_PIXEL_CHUNKS:
+            parts.append(image_bytes[offset:end])
+        offset = end
+    return b''.join(parts)
+
+
+def imageHash(image_bytes):
+    return hashlib.sha256(normalizeImageBytes(image_bytes)).hexdigest()
+
+
+class ResultCache:
+    """ Recognition results keyed by image content and provider, in memory (LRU) and on disk """
+
+    def __init__(self, directory=CACHE_DIR, maxEntries=256, maxDiskBytes=64 * 1024 * 1024,
+                 maxAge=30 * 24 * 3600):
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.maxDiskBytes = maxDiskBytes
+        self.maxAge = maxAge
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.diskLock = threading.Lock()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.diskBytes = None
+
+    @staticmethod
+    def makeKey(image_bytes, provider):
+        digest = hashlib.sha256(provider.encode('utf-8') + b'\0')
+        digest.update(normalizeImageBytes(image_bytes))
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                # callers decorate the results they get, the cached one must stay as recognized
+                return copy.deepcopy(result)
+
+        result = self._readDisk(key)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.diskHits += 1
+            self._remember(key, copy.deepcopy(result))
+        return result
+
+    def put(self, key, result):
+        with self.lock:
+            self._remember(key, copy.deepcopy(result))
+        self._writeDisk(key, result)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.hits = self.diskHits = self.misses = 0
+        with self.diskLock:
+            for path, _, _ in self._diskEntries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self.diskBytes = None  # counted again on the next write, some files may have survived
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "diskHits": self.diskHits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.memory),
+            }
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxEntries:
+            self.memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _readDisk(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.maxAge:
+                self._expire(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _expire(self, path):
+        with self.diskLock:
+            try:
+                stat = os.stat(path)
+                if time.time() - stat.st_mtime <= self.maxAge:
+                    return  # written again since it was found expired
+                os.remove(path)
+            except OSError:
+                return
+            if self.diskBytes is not None:
+                self.diskBytes -= stat.st_size
+
+    def _writeDisk(self, key, result):
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+            # a temporary file of its own, two threads storing the same key must not write into one file
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except OSError:
+            return
+
+        with self.diskLock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                return
+            if self.diskBytes is None:
+                self.diskBytes = sum(size for _, size, _ in self._diskEntries())
+            else:
+                self.diskBytes += len(data) - replaced
+            if self.diskBytes > self.maxDiskBytes:
+                self._prune()
+
+    def _diskEntries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _prune(self):
+        """ drop expired entries, then the oldest ones until the store fits in half its budget """
+        now = time.time()
+        entries = sorted(self._diskEntries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, mtime in entries:
+            if now - mtime <= self.maxAge and total <= self.maxDiskBytes // 2:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.diskBytes = total
+
+
+resultCache = ResultCache()
@@ -0,0 +1,267 @@
+""" Headless recognition: `python cli.py formula.png notes/ "crops/**/*.png" --format jsonl` """
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import collectImages
+from cache import resultCache
+from credentials import credentials, InvalidToken
+from ocr_services import OCRClient, PROVIDER_NAMES, resultToText
+from ratelimit import limiters
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BASE_DIR, 'resource', 'config.json')
+SERVICES = {name.lower(): service for service, name in PROVIDER_NAMES.items()}
+
+
+def positiveFloat(value):
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not number > 0:
+        raise argparse.ArgumentTypeError(f"expected a positive number, got {value!r}")
+    return number
+
+
+def positiveInt(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive whole number, got {value!r}")
+    return number
+
+
+def quotaArg(value):
+    """ `RATE` for the configured service or `PROVIDER=RATE`, as (provider or None, rate) """
+    provider, separator, rate = value.rpartition("=")
+    provider = provider.strip().lower() if separator else None
+    if provider is not None and provider not in SERVICES:
+        raise argparse.ArgumentTypeError(f"unknown provider {provider!r}, expected one of {', '.join(sorted(SERVICES))}")
+    return provider, positiveFloat(rate)
+
+
+def readApiConfig(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get("API", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def decryptKey(encrypted_text):
+    try:
+        return credentials.decrypt(encrypted_text)
+    except (InvalidToken, ValueError):
+        return ""
+
+
+def loadApiSettings(path=CONFIG_FILE):
+    """ the service, id and decrypted key saved by the settings page, read without Qt """
+    api = readApiConfig(path)
+    service = SERVICES.get(api.get("Service", "").lower())
+    return service, api.get("ID", ""), decryptKey(api.get("Key", ""))
+
+
+def loadFallbacks(args, primary):
+    """ (service, credentials) of the other services configured in the settings page,
+        empty unless failover is switched on there or with --failover
+    """
+    api = readApiConfig(args.config)
+    if not (args.failover or api.get("Failover")):
+        return []
+
+    fallbacks = []
+    for name, saved in api.get("Credentials", {}).items():
+        service = SERVICES.get(name.lower())
+        key = decryptKey(saved.get("Key", ""))
+        if service is not None and service != primary and saved.get("ID") and key:
+            fallbacks.append((service, {"id": saved["ID"], "key": key}))
+    return fallbacks
+
+
+def loadQuotas(args, primary):
+    """ {service: requests per second} from the settings' quotas, overridden by --qps """
+    quotas = {}
+    for name, rate in readApiConfig(args.config).get("Quotas", {}).items():
+        service = SERVICES.get(name.lower())
+        if service is not None and isinstance(rate, (int, float)) and rate > 0:
+            quotas[service] = float(rate)
+    for provider, rate in args.qps or ():
+        quotas[SERVICES[provider] if provider else primary] = rate
+    return quotas
+
+
+def useInstallResources():
+    """ the GUI resolves resource/ from its working directory, scripts may run from anywhere """
+    credentials.keyFile = os.path.join(BASE_DIR, 'resource', 'fernet_key')
+
+
+def resolveApiSettings(args):
+    """ the configured service and credentials with command-line overrides, None when incomplete """
+    service, access_key_id, access_key_secret = loadApiSettings(args.config)
+    if args.provider:
+        service = SERVICES[args.provider]
+    access_key_id = args.id or access_key_id
+    access_key_secret = args.key or access_key_secret
+    if service is None or not access_key_id or not access_key_secret:
+        print("error: no API service, id or key configured, set them in the settings page "
+              "or pass --provider/--id/--key", file=sys.stderr)
+        return None
+    return service, access_key_id, access_key_secret
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize LaTeX formulas in images without starting the GUI.")
+    parser.add_argument("inputs", nargs="*",
+                        help="image files, folders or glob patterns; '-' reads one image from stdin; "
+                             "without inputs, paths are read from stdin one per line")
+    parser.add_argument("-p", "--provider", choices=sorted(SERVICES), help="override the configured API service")
+    parser.add_argument("--id", help="override the configured API id")
+    parser.add_argument("--key", help="override the configured API key")
+    parser.add_argument("--failover", action="store_true",
+                        help="hedge and fail over to the other services configured in the settings page")
+    parser.add_argument("--qps", type=quotaArg, action="append", metavar="[PROVIDER=]RATE",
+                        help="requests per second allowed by a provider's quota, the configured service's "
+                             "when no provider is named; repeat for each provider")
+    parser.add_argument("-j", "--concurrency", type=int, default=4, help="requests in flight at once (default: 4)")
+    parser.add_argument("-f", "--format", choices=["latex", "jsonl"], default="latex", help="output format")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="crop and shrink images before upload (needs PyQt5.QtGui)")
+    parser.add_argument("--no-cache", action="store_true", help="always call the provider")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="keep all requests on one event loop instead of a thread per request")
+    parser.add_argument("--config", default=CONFIG_FILE, help="config.json written by the settings page")
+    args = parser.parse_args(argv)
+    if not args.inputs and (sys.stdin is None or sys.stdin.isatty()):
+        # nothing is piped in, reading paths from the terminal would just wait for input
+        parser.error("no inputs: pass image files, folders or patterns, or pipe paths in on stdin")
+    return args
+
+
+def readInputs(args):
+    """ (label, image) pairs, the image being a path or raw bytes """
+    if args.inputs == ["-"]:
+        return [("<stdin>", sys.stdin.buffer.read())]
+
+    paths = args.inputs or [line.strip() for line in sys.stdin if line.strip()]
+    return [(path, path) for path in collectImages(paths)]
+
+
+def recognize(ocr_client, image, preprocess):
+    start = time.perf_counter()
+    try:
+        if preprocess is not None:
+            image = preprocess(image, ocr_client.service)
+            if image is None:
+                raise ValueError("Could not load the image.")
+        result = dict(ocr_client.recognizeText(image))
+    except Exception as e:
+        result = {"status": False, "message": str(e) or type(e).__name__}
+    result["latency"] = time.perf_counter() - start
+    return result
+
+
+async def recognizeAsync(ocr_client, image, preprocess, semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if preprocess is not None:
+                image = await asyncio.to_thread(preprocess, image, ocr_client.service)
+                if image is None:
+                    raise ValueError("Could not load the image.")
+            result = dict(await ocr_client.recognizeText(image))
+        except Exception as e:
+            result = {"status": False, "message": str(e) or type(e).__name__}
+        result["latency"] = time.perf_counter() - start
+        return result
+
+
+async def recognizeAllAsync(service, inputs, concurrency, preprocess, cache, fallbacks=(), **kwargs):
+    """ yield results in input order while up to `concurrency` requests share the event loop """
+    from async_services import AsyncOCRClient
+
+    ocr_client = AsyncOCRClient(service, cache=cache, fallbacks=fallbacks, **kwargs)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(recognizeAsync(ocr_client, image, preprocess, semaphore))
+             for _, image in inputs]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        await ocr_client.close()
+
+
+def formatResult(label, result, outputFormat, multiple):
+    if outputFormat == "jsonl":
+        record = {"file": label, "status": result["status"], "latency": round(result["latency"], 4)}
+        if result["status"]:
+            record["latex"] = resultToText(result)
+        else:
+            record["message"] = result.get("message", "")
+        return json.dumps(record, ensure_ascii=False)
+
+    if not result["status"]:
+        return None
+    latex = resultToText(result)
+    return f"% {label}\n{latex}" if multiple else latex
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    useInstallResources()
+    settings = resolveApiSettings(args)
+    if settings is None:
+        return 2
+    service, access_key_id, access_key_secret = settings
+    limiters.update(loadQuotas(args, service))
+
+    inputs = readInputs(args)
+    if not inputs:
+        print("error: no images to recognize", file=sys.stderr)
+        return 2
+
+    preprocess = None
+    if args.preprocess:
+        from preprocess import preprocessImage as preprocess
+
+    cache = None if args.no_cache else resultCache
+    fallbacks = loadFallbacks(args, service)
+    concurrency = max(1, args.concurrency)
+    failed = 0
+
+    def report(label, result):
+        nonlocal failed
+        if not result["status"]:
+            failed += 1
+            if args.format == "latex":
+                print(f"{label}: {result.get('message', 'Recognition Failed')}", file=sys.stderr)
+        line = formatResult(label, result, args.format, len(inputs) > 1)
+        if line is not None:
+            print(line, flush=True)
+
+    if args.use_async:
+        async def run():
+            labels = iter(label for label, _ in inputs)
+            async for result in recognizeAllAsync(service, inputs, concurrency, preprocess, cache, fallbacks,
+                                                  id=access_key_id, key=access_key_secret):
+                report(next(labels), result)
+
+        asyncio.run(run())
+    else:
+        ocr_client = OCRClient(service, cache=cache, fallbacks=fallbacks, id=access_key_id, key=access_key_secret)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = pool.map(lambda item: recognize(ocr_client, item[1], preprocess), inputs)
+            for (label, _), result in zip(inputs, results):
+                report(label, result)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
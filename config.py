@@ -1,8 +1,10 @@
+import json
+import os
 from enum import Enum
 
 from PyQt5.QtCore import QLocale
 from qfluentwidgets import (QConfig, ConfigSerializer, OptionsConfigItem, OptionsValidator, qconfig,
-                            ConfigItem, EnumSerializer)
+                            ConfigItem, EnumSerializer, BoolValidator)
 
 
 class Language(Enum):
@@ -23,6 +25,20 @@ class LanguageSerializer(ConfigSerializer):
         return Language(QLocale(value)) if value != "Auto" else Language.AUTO
 
 
+def saveConfig(self):
+    """ write through a temporary file so an interrupted save never leaves a truncated config """
+    config = self._cfg
+    config.file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = config.file.with_suffix('.tmp')
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(config.toDict(), f, ensure_ascii=False, indent=4)
+    os.replace(temp_file, config.file)
+
+
+# replaced on the base class, so `qconfig.set` in qfluentwidgets' own setting cards and theme code saves this way too
+QConfig.save = saveConfig
+
+
 class Config(QConfig):
 
     language = OptionsConfigItem(
@@ -37,6 +53,20 @@ class Config(QConfig):
     apiKey = ConfigItem(
         "API", "Key", "")
 
+    # {"SimpleTex": {"ID": ..., "Key": <encrypted>}, ...} for every provider the user has set up
+    apiCredentials = ConfigItem(
+        "API", "Credentials", {})
+
+    apiFailover = ConfigItem(
+        "API", "Failover", False, BoolValidator())
+
+    # {"SimpleTex": 5, ...} requests per second allowed by each provider's plan, conservative defaults otherwise
+    apiQuotas = ConfigItem(
+        "API", "Quotas", {})
+
+    previewDocumentMode = ConfigItem(
+        "Preview", "DocumentMode", False, BoolValidator())
+
 
 URL = "https://github.com/wytili/Formulite"
 EMAIL = "wyt_0416@sjtu.edu.cn"
@@ -0,0 +1,57 @@
+import os
+import threading
+
+from cryptography.fernet import Fernet, InvalidToken
+
+KEY_FILE = os.path.join('resource', 'fernet_key')
+
+
+class CredentialStore:
+    """ Process-wide Fernet key and secret cache, the key file is read at most once """
+
+    def __init__(self, keyFile=KEY_FILE):
+        self.keyFile = keyFile
+        self.fernet = None
+        self.plainTexts = {}  # token -> secret
+        self.tokens = {}  # secret -> token
+        self.lock = threading.Lock()
+
+    def getFernet(self):
+        with self.lock:
+            if self.fernet is None:
+                if not os.path.exists(self.keyFile):
+                    key = Fernet.generate_key()
+                    with open(self.keyFile, 'wb') as file:
+                        file.write(key)
+                else:
+                    with open(self.keyFile, 'rb') as file:
+                        key = file.read()
+                self.fernet = Fernet(key)
+            return self.fernet
+
+    def encrypt(self, text):
+        if text == "":
+            return ""
+        token = self.tokens.get(text)
+        if token is None:
+            token = self.getFernet().encrypt(text.encode()).decode()
+            self.remember(token, text)
+        return token
+
+    def decrypt(self, token):
+        """ decrypt a token, raises `InvalidToken` when it was not made with this key """
+        if token == "":
+            return ""
+        text = self.plainTexts.get(token)
+        if text is None:
+            text = self.getFernet().decrypt(token.encode()).decode()
+            self.remember(token, text)
+        return text
+
+    def remember(self, token, text):
+        with self.lock:
+            self.plainTexts[token] = text
+            self.tokens[text] = token
+
+
+credentials = CredentialStore()
@@ -0,0 +1,78 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class RecognitionExecutor(QObject):
+    """ Run recognition jobs on a worker pool and report back through signals """
+
+    jobStarted = pyqtSignal(int)
+    jobFinished = pyqtSignal(int, dict)
+    jobFailed = pyqtSignal(int, str)
+    jobCancelled = pyqtSignal(int)
+
+    def __init__(self, maxWorkers=4, parent=None):
+        super().__init__(parent=parent)
+        self.pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="recognition")
+        self.jobIds = itertools.count(1)
+        self.futures = {}
+        self.events = {}  # jobId -> Event set on cancel, so a job waiting to retry stops early
+        self.cancelled = set()
+        self.lock = threading.RLock()
+
+    def submit(self, fn, *args, **kwargs):
+        """ queue `fn(*args, cancelled=<threading.Event>, **kwargs)` and return the id of the new job """
+        jobId = next(self.jobIds)
+        with self.lock:
+            self.events[jobId] = kwargs["cancelled"] = threading.Event()
+            future = self.pool.submit(self._run, jobId, fn, args, kwargs)
+            self.futures[jobId] = future
+        future.add_done_callback(lambda f: self._onDone(jobId, f))
+        return jobId
+
+    def cancel(self, jobId):
+        """ cancel a job, a job already in flight has its result discarded """
+        with self.lock:
+            future = self.futures.pop(jobId, None)
+            if future is None:
+                return False
+            self.events.pop(jobId).set()
+            if not future.cancel():
+                self.cancelled.add(jobId)
+        self.jobCancelled.emit(jobId)
+        return True
+
+    def cancelAll(self):
+        with self.lock:
+            jobIds = list(self.futures)
+        for jobId in jobIds:
+            self.cancel(jobId)
+
+    def shutdown(self):
+        self.cancelAll()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, jobId, fn, args, kwargs):
+        with self.lock:
+            if jobId in self.cancelled:
+                return None
+        self.jobStarted.emit(jobId)
+        return fn(*args, **kwargs)
+
+    def _onDone(self, jobId, future):
+        # runs on the worker thread, signals are queued to the receivers' thread
+        with self.lock:
+            if jobId in self.cancelled:
+                self.cancelled.discard(jobId)
+                return
+            if self.futures.pop(jobId, None) is None:
+                return
+            self.events.pop(jobId, None)
+
+        error = future.exception()
+        if error is not None:
+            self.jobFailed.emit(jobId, str(error) or type(error).__name__)
+        else:
+            self.jobFinished.emit(jobId, future.result())
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import Qt, QTimer, QSize, QModelIndex, QAbstractListModel, QObject, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QApplication, QListView
+from qfluentwidgets import SearchLineEdit, ListView, InfoBar, BodyLabel, isDarkTheme
+
+from history_store import history
+from render import renderer, svgToPixmap
+
+THUMBNAIL_SIZE = QSize(96, 48)
+
+
+class ThumbnailLoader(QObject):
+    """ Decode and scale history images on a worker thread, keep the results in a bounded cache """
+
+    loaded = pyqtSignal(str)
+
+    def __init__(self, maxEntries=512, parent=None):
+        super().__init__(parent=parent)
+        self.maxEntries = maxEntries
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        # decoded on the worker, turned into pixmaps on the GUI thread; rows scrolled away before they
+        # were painted would otherwise keep theirs forever, so this is an LRU of the same size
+        self.images = OrderedDict()
+        self.imagesLock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+
+    def thumbnail(self, image_hash):
+        """ the cached pixmap, or None while it is being generated """
+        pixmap = self.pixmaps.get(image_hash)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(image_hash)
+            return pixmap
+
+        with self.imagesLock:
+            image = self.images.pop(image_hash, None)
+        if image is not None:
+            pixmap = QPixmap.fromImage(image)
+            self.pixmaps[image_hash] = pixmap
+            while len(self.pixmaps) > self.maxEntries:
+                self.pixmaps.popitem(last=False)
+            return pixmap
+
+        if image_hash not in self.pending:
+            self.pending.add(image_hash)
+            self.pool.submit(self._load, image_hash)
+        return None
+
+    def _load(self, image_hash):
+        try:
+            data = history.image(image_hash)
+            image = QImage.fromData(data) if data else QImage()
+            if not image.isNull():
+                image = image.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            with self.imagesLock:
+                self.images[image_hash] = image
+                while len(self.images) > self.maxEntries:
+                    self.images.popitem(last=False)
+        finally:
+            # a failed load is tried again the next time the row is painted
+            self.pending.discard(image_hash)
+        self.loaded.emit(image_hash)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class HistoryModel(QAbstractListModel):
+    """ History records fetched page by page as the view scrolls """
+
+    PAGE_SIZE = 200
+    LatexRole = Qt.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.records = []
+        self.rowsByHash = defaultdict(list)
+        self.rowsByLatex = defaultdict(list)  # records without an image show the rendered formula instead
+        self.formulaPixmaps = OrderedDict()  # (latex, color) -> pixmap
+        self.total = 0
+        self.query = ""
+        self.thumbnails = ThumbnailLoader(parent=self)
+        self.thumbnails.loaded.connect(self.onThumbnailLoaded)
+        renderer.rendered.connect(self.onFormulaRendered)
+
+    def setQuery(self, text):
+        self.beginResetModel()
+        self.query = text
+        self.records = []
+        self.rowsByHash.clear()
+        self.rowsByLatex.clear()
+        renderer.discard(self)
+        self.total = history.count(text)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.records) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        beforeId = self.records[-1][0] if self.records else None
+        rows = history.search(self.query, self.PAGE_SIZE, beforeId)
+        if not rows:
+            self.total = len(self.records)
+            return
+
+        first = len(self.records)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.records.extend(rows)
+        for row, record in enumerate(rows, first):
+            if record[3]:
+                self.rowsByHash[record[3]].append(row)
+            else:
+                self.rowsByLatex[record[4]].append(row)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        _, timestamp, provider, image_hash, latex, latency = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+            details = f"{when} · {provider}"
+            if latency is not None:
+                details += f" · {latency:.2f} s"
+            return f"{details}\n{latex}"
+        elif role == Qt.DecorationRole:
+            return self.thumbnails.thumbnail(image_hash) if image_hash else self.formulaThumbnail(latex)
+        elif role in (Qt.ToolTipRole, self.LatexRole):
+            return latex
+        return None
+
+    def formulaThumbnail(self, latex):
+        color = "#ffffff" if isDarkTheme() else "#000000"
+        pixmap = self.formulaPixmaps.get((latex, color))
+        if pixmap is not None:
+            self.formulaPixmaps.move_to_end((latex, color))
+            return pixmap
+
+        svg = renderer.svg(latex, self)
+        if svg is None:
+            return None
+        pixmap = self.formulaPixmaps[(latex, color)] = svgToPixmap(svg, THUMBNAIL_SIZE, color)
+        while len(self.formulaPixmaps) > self.thumbnails.maxEntries:
+            self.formulaPixmaps.popitem(last=False)
+        return pixmap
+
+    def onThumbnailLoaded(self, image_hash):
+        for row in self.rowsByHash.get(image_hash, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def onFormulaRendered(self, latex):
+        for row in self.rowsByLatex.get(latex, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class HistoryInterface(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.setObjectName("History-Interface")
+        layout = QVBoxLayout()
+
+        self.searchEdit = SearchLineEdit(self)
+        self.searchEdit.setPlaceholderText(self.tr("Search LaTeX, e.g. \\frac"))
+        self.countLabel = BodyLabel(self)
+
+        # only the visible rows are laid out and painted, pages are fetched on scroll
+        self.model = HistoryModel(self)
+        self.listView = ListView(self)
+        self.listView.setModel(self.model)
+        self.listView.setUniformItemSizes(True)
+        self.listView.setIconSize(THUMBNAIL_SIZE)
+        self.listView.setLayoutMode(QListView.Batched)
+        self.listView.setBatchSize(100)
+
+        layout.addWidget(self.searchEdit)
+        layout.addWidget(self.countLabel)
+        layout.addWidget(self.listView)
+        self.setLayout(layout)
+
+        # search once the user stops typing
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(200)
+        self.searchTimer.timeout.connect(self.refresh)
+        self.searchEdit.textChanged.connect(lambda: self.searchTimer.start())
+        self.searchEdit.searchSignal.connect(self.refresh)
+        self.listView.doubleClicked.connect(self.copyItem)
+        QApplication.instance().aboutToQuit.connect(self.model.thumbnails.shutdown)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def refresh(self):
+        text = self.searchEdit.text()
+        self.model.setQuery(text)
+        self.countLabel.setText(self.tr("{count} records").format(count=self.model.total))
+
+    def copyItem(self, index):
+        QApplication.clipboard().setText(index.data(HistoryModel.LatexRole))
+        InfoBar.success(
+            title=self.tr("Copied"),
+            content=self.tr("Text copied to clipboard."),
+            parent=self
+        ).show()
@@ -0,0 +1,198 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    provider TEXT NOT NULL,
+    image_hash TEXT,
+    latex TEXT NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS history_image ON history (image_hash);
+CREATE TABLE IF NOT EXISTS images (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS history_images_ad AFTER DELETE ON history WHEN old.image_hash IS NOT NULL BEGIN
+    DELETE FROM images WHERE hash = old.image_hash
+        AND NOT EXISTS (SELECT 1 FROM history WHERE image_hash = old.image_hash);
+END;
+"""
+
+# backslash is part of a token so `\frac` is searchable as one word
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    latex, content='history', content_rowid='id', tokenize="unicode61 tokenchars '\\'"
+);
+CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts (rowid, latex) VALUES (new.id, new.latex);
+END;
+CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts (history_fts, rowid, latex) VALUES ('delete', old.id, old.latex);
+END;
+"""
+
+log = logging.getLogger(__name__)
+
+COLUMNS = "history.id, history.timestamp, history.provider, history.image_hash, history.latex, history.latency"
+
+
+def ftsQuery(text):
+    """ turn free text into an FTS5 query matching every token as a prefix """
+    tokens = text.split()
+    return " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+class HistoryStore:
+    """ Recognition and preview history in SQLite, written in batches by a background thread """
+
+    def __init__(self, path=os.path.join('resource', 'history.db'), batchSize=64, flushInterval=0.5):
+        self.path = path
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.queue = queue.Queue()
+        self.writer = None
+        self.readers = threading.local()
+        self.lock = threading.Lock()
+        self.fts = True
+        self.initialized = False
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            if not self.initialized:
+                connection.executescript(SCHEMA)
+                try:
+                    connection.executescript(FTS_SCHEMA)
+                except sqlite3.OperationalError:
+                    # sqlite built without FTS5, searches fall back to LIKE
+                    self.fts = False
+                connection.commit()
+                self.initialized = True
+        return connection
+
+    def reader(self):
+        connection = getattr(self.readers, 'connection', None)
+        if connection is None:
+            connection = self.connect()
+            self.readers.connection = connection
+        return connection
+
+    def add(self, provider, latex, image_hash=None, latency=None, timestamp=None, image=None):
+        """ queue a record, never blocks on disk, `image` is a thumbnail of the upload stored under its hash
+
+        an image lives as long as some record refers to it
+        """
+        self.queue.put(((timestamp or time.time(), provider, image_hash, latex, latency),
+                        (image_hash, image) if image_hash and image else None))
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._writeLoop, name="history-writer", daemon=True)
+                self.writer.start()
+
+    def flush(self):
+        """ block until every queued record is on disk """
+        if self.writer is not None:
+            self.queue.join()
+
+    def close(self):
+        self.flush()
+        connection = getattr(self.readers, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.readers.connection = None
+
+    def _writeLoop(self):
+        try:
+            connection = self.connect()
+        except sqlite3.Error as e:
+            log.error("Cannot open the history database %s: %s", self.path, e)
+            with self.lock:
+                # let `flush` return, the next `add` starts a writer that tries again
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.queue.task_done()
+                self.writer = None
+            return
+
+        while True:
+            records = [self.queue.get()]
+            deadline = time.monotonic() + self.flushInterval
+            while len(records) < self.batchSize:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    records.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO history (timestamp, provider, image_hash, latex, latency) "
+                        "VALUES (?, ?, ?, ?, ?)", [record for record, _ in records])
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO images (hash, data) VALUES (?, ?)",
+                        [image for _, image in records if image is not None])
+            except sqlite3.Error as e:
+                log.error("History write error: %s", e)
+            finally:
+                for _ in records:
+                    self.queue.task_done()
+
+    def _where(self, text, beforeId=None):
+        joins, conditions, params = "", [], []
+        if text.strip():
+            if self.fts:
+                joins = "JOIN history_fts ON history_fts.rowid = history.id"
+                conditions.append("history_fts MATCH ?")
+                params.append(ftsQuery(text))
+            else:
+                conditions.append("history.latex LIKE ?")
+                params.append(f"%{text.strip()}%")
+        if beforeId is not None:
+            conditions.append("history.id < ?")
+            params.append(beforeId)
+
+        where = f"{joins} WHERE {' AND '.join(conditions)}" if conditions else joins
+        return where, tuple(params)
+
+    def search(self, text="", limit=100, beforeId=None):
+        """ newest records first, filtered by LaTeX tokens when `text` is given
+
+        pages continue from the id of the last record seen instead of an OFFSET,
+        so fetching deep into a large history costs the same as the first page
+        """
+        where, params = self._where(text, beforeId)
+        cursor = self.reader().execute(
+            f"SELECT {COLUMNS} FROM history {where} ORDER BY history.id DESC LIMIT ?", params + (limit,))
+        return cursor.fetchall()
+
+    def count(self, text=""):
+        where, params = self._where(text)
+        return self.reader().execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+
+    def image(self, image_hash):
+        row = self.reader().execute("SELECT data FROM images WHERE hash = ?", (image_hash,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, recordId):
+        connection = self.reader()
+        with connection:
+            connection.execute("DELETE FROM history WHERE id = ?", (recordId,))
+
+
+history = HistoryStore()
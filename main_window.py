@@ -9,21 +9,29 @@ from qfluentwidgets import FluentIcon as FIF
 from qframelesswindow import FramelessWindow, StandardTitleBar
 
 from config import cfg
+from history import HistoryInterface
+from history_store import history
 from recognition import RecognitionInterface
 from preview import PreviewInterface
 from settings import SettingInterface
 
 
-class Widget(QWidget):
-    def __init__(self, text: str, parent=None):
-        super().__init__(parent=parent)
-        self.label = QLabel(text, self)
-        self.hBoxLayout = QHBoxLayout(self)
+class LazyInterface(QWidget):
+    """ Placeholder that builds its interface the first time it is shown """
 
-        self.label.setAlignment(Qt.AlignCenter)
-        self.hBoxLayout.addWidget(self.label, 1, Qt.AlignCenter)
+    def __init__(self, objectName: str, factory, parent=None):
+        super().__init__(parent=parent)
+        self.setObjectName(objectName)
+        self.factory = factory
+        self.interface = None
+        self.vBoxLayout = QVBoxLayout(self)
+        self.vBoxLayout.setContentsMargins(0, 0, 0, 0)
 
-        self.setObjectName(text.replace(' ', '-'))
+    def ensureCreated(self):
+        if self.interface is None:
+            self.interface = self.factory()
+            self.vBoxLayout.addWidget(self.interface)
+        return self.interface
 
 
 class NavigationBar(QWidget):
@@ -107,11 +115,12 @@ class Window(FramelessWindow):
 
         cfg.themeChanged.connect(self.onThemeChanged)
 
-        # create sub interface
+        # create sub interface, only the first page is built up front, the preview page
+        # starts Chromium so it waits until the user opens it
         self.recognitionInterface = RecognitionInterface()
-        self.previewInterface = PreviewInterface()
-        self.historyInterface = Widget(self.tr("To be finished..."), self)
-        self.settingInterface = SettingInterface()
+        self.previewInterface = LazyInterface("Preview-Interface", PreviewInterface, self)
+        self.historyInterface = LazyInterface("History-Interface", HistoryInterface, self)
+        self.settingInterface = LazyInterface("Setting-Interface", SettingInterface, self)
 
         self.stackWidget.addWidget(self.recognitionInterface)
         self.stackWidget.addWidget(self.previewInterface)
@@ -124,11 +133,11 @@ class Window(FramelessWindow):
         # add items to navigation interface
         self.initNavigation()
 
-        # animation duration
-        QTimer.singleShot(1600, self.splashScreen.close)
-
         self.initWindow()
 
+        # runs on the first event loop iteration, i.e. once the window has been painted
+        QTimer.singleShot(0, self.onWindowReady)
+
     def initLayout(self):
         self.vBoxLayout.setSpacing(0)
         self.vBoxLayout.setContentsMargins(0, self.titleBar.height(), 0, 0)
@@ -178,11 +187,19 @@ class Window(FramelessWindow):
 
         self.setQss()
 
+    def onWindowReady(self):
+        self.splashScreen.close()
+        self.recognitionInterface.input.warmUp()
+        # settings are cheap to build, warm them while the user looks at the first page
+        QTimer.singleShot(500, self.settingInterface.ensureCreated)
+
     def switchTo(self, widget):
         self.stackWidget.setCurrentWidget(widget)
 
     def onCurrentInterfaceChanged(self, index):
         widget = self.stackWidget.widget(index)
+        if isinstance(widget, LazyInterface):
+            widget.ensureCreated()
         self.navigationInterface.setCurrentItem(widget.objectName())
 
     def switchTheme(self):
@@ -216,6 +233,7 @@ if __name__ == '__main__':
 
     app.installTranslator(fluentTranslator)
     app.installTranslator(translator)
+    app.aboutToQuit.connect(history.close)
 
     w = Window()
     w.show()
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds in seconds, from PNG encoding of a small crop up to a provider timing out
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGES = ("capture", "encode", "sign", "network", "parse", "display", "total")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """ interpolated inside the bucket holding the quantile, like Prometheus' histogram_quantile """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """ Per-stage timing histograms of the recognition pipeline, keyed by (stage, provider) """
+
+    def __init__(self):
+        self.histograms = {}
+        self.outcomes = {}  # (provider, "success" | "failure") -> count
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, provider, seconds):
+        with self.lock:
+            histogram = self.histograms.get((stage, provider))
+            if histogram is None:
+                histogram = self.histograms[(stage, provider)] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, provider):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, provider, time.perf_counter() - start)
+
+    def countOutcome(self, provider, success):
+        key = (provider, "success" if success else "failure")
+        with self.lock:
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.outcomes.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """ {"uptime", "stages": [{"stage", "provider", "count", "mean", "p50", ...}], "outcomes": [...]} """
+        with self.lock:
+            rows = [dict(stage=stage, provider=provider, **histogram.summary())
+                    for (stage, provider), histogram in self.histograms.items()]
+            outcomes = [{"provider": provider, "outcome": outcome, "count": count}
+                        for (provider, outcome), count in self.outcomes.items()]
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        rows.sort(key=lambda row: (order.get(row["stage"], len(STAGES)), row["provider"]))
+        return {"uptime": time.time() - self.started, "stages": rows, "outcomes": outcomes}
+
+    def toJson(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def toPrometheus(self):
+        snapshot = self.snapshot()
+        lines = ["# HELP formulite_stage_seconds Time spent in each stage of a recognition.",
+                 "# TYPE formulite_stage_seconds histogram"]
+        for row in snapshot["stages"]:
+            labels = f'stage="{row["stage"]}",provider="{row["provider"]}"'
+            cumulative = 0
+            for bound, count in row["buckets"].items():
+                cumulative += count
+                lines.append(f'formulite_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'formulite_stage_seconds_sum{{{labels}}} {row["sum"]}')
+            lines.append(f'formulite_stage_seconds_count{{{labels}}} {row["count"]}')
+
+        lines += ["# HELP formulite_recognitions_total Recognitions by provider and outcome.",
+                  "# TYPE formulite_recognitions_total counter"]
+        for row in snapshot["outcomes"]:
+            lines.append(f'formulite_recognitions_total{{provider="{row["provider"]}",'
+                         f'outcome="{row["outcome"]}"}} {row["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
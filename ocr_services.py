@@ -1,33 +1,79 @@
 import base64
 import hashlib
 import json
+import logging
 import random
 import requests
+import socket
 import string
+import threading
 import time
+from urllib.parse import urlsplit
 
-from tencentcloud.common import credential
-from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
-from tencentcloud.common.profile.client_profile import ClientProfile
-from tencentcloud.common.profile.http_profile import HttpProfile
-from tencentcloud.ocr.v20181119 import ocr_client, models as tencent_models
+from requests.adapters import HTTPAdapter
 
-from alibabacloud_ocr_api20210707.client import Client as OcrClient
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_ocr_api20210707 import models as ocr_models
-from alibabacloud_tea_util import models as util_models
+from cache import ResultCache, resultCache
+from metrics import metrics
+from ratelimit import limiters, parseRetryAfter, retryDelay
+
+# the cloud SDKs are slow to import, they are loaded by the first client that needs them (or by `warmup`)
+
+log = logging.getLogger(__name__)
 
 
 class RecognitionService:
+    """ `recognizeFormula` returns {"status": True, "result": [...]} or {"status": False, "message": ...},
+        failures worth retrying (throttling, server or network errors) also carry "retryable": True
+    """
+
     def recognizeFormula(self, image_data):
         raise NotImplementedError
 
+    def warmup(self):
+        """ pay the first request's setup costs ahead of time: SDK import, client, DNS and connection """
+        pass
+
+    def close(self):
+        pass
+
+
+def readImageBytes(image_data):
+    if isinstance(image_data, str):
+        with open(image_data, 'rb') as f:
+            return f.read()
+    elif isinstance(image_data, bytes):
+        return image_data
+    else:
+        raise ValueError("Unsupported image data type")
+
+
+def resolveEndpoint(endpoint, port=443):
+    """ look the host up once so the operating system's resolver cache is warm """
+    socket.getaddrinfo(urlsplit(f"//{endpoint}").hostname, port, type=socket.SOCK_STREAM)
+
+
+def resultToText(recognition_result):
+    """ join the formulas of an `OCRClient.recognizeText` result into one LaTeX string """
+    detected_texts = []  # store all detected texts
+    for result in recognition_result.get('results', []):
+        if isinstance(result, dict):  # check if the result is a dict
+            detected_texts.append(result.get('DetectedText', ''))
+        elif isinstance(result, str):  # check if the result is a string
+            detected_texts.append(result)
+    return "\n".join(detected_texts)
+
 
 class SimpleTex(RecognitionService):
-    def __init__(self, id, key):
+    name = "SimpleTex"
+
+    def __init__(self, id, key, endpoint="server.simpletex.cn", scheme="https"):
         self.app_id = id
         self.app_secret = key
-        self.api_url = "https://server.simpletex.cn/api/latex_ocr"
+        self.base_url = f"{scheme}://{endpoint}/"
+        self.api_url = f"{self.base_url}api/latex_ocr"
+        # keep-alive session so consecutive requests reuse the TLS connection
+        self.session = requests.Session()
+        self.session.mount(f"{scheme}://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
 
     @staticmethod
     def generateRandomStr(length=16):
@@ -40,113 +86,296 @@ class SimpleTex(RecognitionService):
         sign = hashlib.md5(sign_str.encode('utf-8')).hexdigest()
         return random_str, timestamp, sign
 
-    def recognizeFormula(self, image_data):
+    def generateHeaders(self):
         random_str, timestamp, sign = self.generateSign()
-        headers = {"app-id": self.app_id, "random-str": random_str, "timestamp": timestamp, "sign": sign}
+        return {"app-id": self.app_id, "random-str": random_str, "timestamp": timestamp, "sign": sign}
+
+    @staticmethod
+    def parseResponse(status_code, result, retryAfter=None):
+        """ turn the HTTP status, decoded JSON body and Retry-After header into a recognition result """
+        if status_code == 200:
+            if result.get("status"):
+                return {"status": True, "result": [result["res"].get("latex", "")]}
+            else:
+                return {"status": False, "message": result.get("message", "Unknown error")}
+        else:
+            return {"status": False, "message": f"HTTP Request Failed with status code {status_code}",
+                    "retryable": status_code == 429 or status_code >= 500,
+                    "retryAfter": parseRetryAfter(retryAfter)}
+
+    def recognizeFormula(self, image_data):
+        with metrics.timer("sign", self.name):
+            headers = self.generateHeaders()
 
         if isinstance(image_data, str):
-            files = {"file": (image_data, open(image_data, "rb"), "image/png")}
+            files = {"file": (image_data, readImageBytes(image_data), "image/png")}
         elif isinstance(image_data, bytes):
             files = {"file": ("image.png", image_data, "image/png")}
         else:
             raise ValueError("Unsupported image data type")
 
-        response = requests.post(self.api_url, files=files, headers=headers)
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("status"):
-                return {"status": True, "result": [result["res"].get("latex", "")]}
-            else:
-                return {"status": False, "message": result.get("message", "Unknown error")}
-        else:
-            return {"status": False, "message": f"HTTP Request Failed with status code {response.status_code}"}
+        try:
+            with metrics.timer("network", self.name):
+                response = self.session.post(self.api_url, files=files, headers=headers)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return {"status": False, "message": str(e), "retryable": True}
+        with metrics.timer("parse", self.name):
+            result = response.json() if response.status_code == 200 else None
+            return self.parseResponse(response.status_code, result, response.headers.get("Retry-After"))
+
+    def warmup(self):
+        # the site root, not the metered API: any answer leaves a handshaken connection to the host in the pool
+        try:
+            self.session.head(self.base_url, timeout=5)
+        except requests.RequestException:
+            pass
+
+    def close(self):
+        self.session.close()
 
 
 class Tencent(RecognitionService):
-    def __init__(self, id, key):
+    name = "TencentCloud"
+    RETRYABLE_CODES = ("RequestLimitExceeded", "InternalError", "ClientNetworkError", "ServerNetworkError")
+
+    def __init__(self, id, key, endpoint="ocr.tencentcloudapi.com", scheme="https"):
         self.secret_id = id
         self.secret_key = key
+        self.endpoint = endpoint
+        self.scheme = scheme
+        self.client = None
+        self.lock = threading.Lock()
+
+    def createClient(self):
+        # the warm-up thread and the first recognitions may all get here at once, build the client only once
+        with self.lock:
+            if self.client is not None:
+                return self.client
+            from tencentcloud.common import credential
+            from tencentcloud.common.profile.client_profile import ClientProfile
+            from tencentcloud.common.profile.http_profile import HttpProfile
+            from tencentcloud.ocr.v20181119 import ocr_client
 
-    def recognizeFormula(self, image_data):
-        try:
             cred = credential.Credential(self.secret_id, self.secret_key)
             httpProfile = HttpProfile()
-            httpProfile.endpoint = "ocr.tencentcloudapi.com"
+            httpProfile.endpoint = self.endpoint
+            httpProfile.scheme = self.scheme
+            httpProfile.keepAlive = True
             clientProfile = ClientProfile()
             clientProfile.httpProfile = httpProfile
-            client = ocr_client.OcrClient(cred, "ap-beijing", clientProfile)
-            if isinstance(image_data, str):
-                with open(image_data, 'rb') as f:
-                    image_bytes = f.read()
-            elif isinstance(image_data, bytes):
-                image_bytes = image_data
-            else:
-                raise ValueError("Unsupported image data type")
+            self.client = ocr_client.OcrClient(cred, "ap-beijing", clientProfile)
+            return self.client
+
+    def warmup(self):
+        # importing the SDK client module also loads its request models
+        self.createClient()
+        resolveEndpoint(self.endpoint)
+
+    def recognizeFormula(self, image_data):
+        from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
+        from tencentcloud.ocr.v20181119 import models as tencent_models
+
+        try:
+            client = self.createClient()
+            image_bytes = readImageBytes(image_data)
             image_base64 = base64.b64encode(image_bytes).decode()
             req = tencent_models.FormulaOCRRequest()
             req.ImageBase64 = image_base64
-            resp = client.FormulaOCR(req)
-            latex = json.loads(resp.to_json_string())
+            # the SDK signs the request inside this call, so "network" includes the signing here
+            with metrics.timer("network", self.name):
+                resp = client.FormulaOCR(req)
+            with metrics.timer("parse", self.name):
+                latex = json.loads(resp.to_json_string())
             return {"status": True, "result": latex['FormulaInfos']}
         except TencentCloudSDKException as err:
-            return {"status": False, "message": str(err)}
+            return {"status": False, "message": str(err),
+                    "retryable": (err.get_code() or "").startswith(self.RETRYABLE_CODES)}
 
 
 class AliYun(RecognitionService):
-    def __init__(self, id, key):
+    name = "Aliyun"
+
+    def __init__(self, id, key, endpoint="ocr-api.cn-hangzhou.aliyuncs.com", scheme="https"):
         super().__init__()
         self.access_key_id = id
         self.access_key_secret = key
+        self.endpoint = endpoint
+        self.scheme = scheme
+        self.client = None
+        self.lock = threading.Lock()
 
     def createClient(self):
-        config = open_api_models.Config(access_key_id=self.access_key_id, access_key_secret=self.access_key_secret)
-        config.endpoint = 'ocr-api.cn-hangzhou.aliyuncs.com'
-        return OcrClient(config)
+        with self.lock:
+            if self.client is not None:
+                return self.client
+            from alibabacloud_ocr_api20210707.client import Client as OcrClient
+            from alibabacloud_tea_openapi import models as open_api_models
+
+            config = open_api_models.Config(access_key_id=self.access_key_id,
+                                            access_key_secret=self.access_key_secret)
+            config.endpoint = self.endpoint
+            config.protocol = self.scheme
+            self.client = OcrClient(config)
+            return self.client
+
+    def warmup(self):
+        self.createClient()
+        resolveEndpoint(self.endpoint)
 
     def recognizeFormula(self, image_data):
+        from alibabacloud_ocr_api20210707 import models as ocr_models
+        from alibabacloud_tea_util import models as util_models
+
         client = self.createClient()
         recognize_request = ocr_models.RecognizeEduFormulaRequest()
-        if isinstance(image_data, str):
-            with open(image_data, 'rb') as f:
-                content = f.read()
-        elif isinstance(image_data, bytes):
-            content = image_data
-        else:
-            raise ValueError("Unsupported image data type")
-
-        recognize_request.body = content
+        recognize_request.body = readImageBytes(image_data)
         runtime = util_models.RuntimeOptions()
         try:
-            response = client.recognize_edu_formula_with_options(recognize_request, runtime)
+            with metrics.timer("network", self.name):
+                response = client.recognize_edu_formula_with_options(recognize_request, runtime)
             response_dict = response.to_map()
             if response_dict['statusCode'] == 200:
-                data_json = response_dict['body']['Data']
-                data = json.loads(data_json)
-                formula_content = data.get('content', 'No content found')
+                with metrics.timer("parse", self.name):
+                    data_json = response_dict['body']['Data']
+                    data = json.loads(data_json)
+                    formula_content = data.get('content', 'No content found')
                 return {"status": True, "result": [formula_content]}
             else:
-                return {"status": False, "message": "HTTP response code: " + str(response_dict['statusCode'])}
+                return {"status": False, "message": "HTTP response code: " + str(response_dict['statusCode']),
+                        "retryable": response_dict['statusCode'] >= 500}
         except Exception as e:
-            return {"status": False, "message": str(e)}
+            code = str(getattr(e, 'code', '') or '')
+            return {"status": False, "message": str(e), "retryable": code.startswith("Throttling")}
 
 
-class OCRClient:
-    def __init__(self, service, **kwargs):
-        self.client = self._get_client_instance(service, **kwargs)
-
-    def _get_client_instance(self, service, **kwargs):
-        if service == 'API.SIMPLETEX':
-            return SimpleTex(**kwargs)
-        elif service == 'API.TENCENTCLOUD':
-            return Tencent(**kwargs)
-        elif service == 'API.ALIYUN':
-            return AliYun(**kwargs)
-        else:
+SERVICES = {
+    'API.SIMPLETEX': SimpleTex,
+    'API.TENCENTCLOUD': Tencent,
+    'API.ALIYUN': AliYun,
+}
+
+PROVIDER_NAMES = {
+    'API.SIMPLETEX': "SimpleTex",
+    'API.TENCENTCLOUD': "TencentCloud",
+    'API.ALIYUN': "Aliyun",
+}
+
+
+class ClientRegistry:
+    """ Long-lived service instances, one per provider, rebuilt when the credentials change """
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, service, **kwargs):
+        if service not in SERVICES:
             raise ValueError("Unsupported service")
 
-    def recognizeText(self, image_data):
-        result = self.client.recognizeFormula(image_data)
+        key = tuple(sorted(kwargs.items()))
+        with self.lock:
+            entry = self.clients.get(service)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+
+            # the replaced client is not closed, recognitions still running on it finish and it is collected after
+            client = SERVICES[service](**kwargs)
+            self.clients[service] = (key, client)
+            return client
+
+    def clear(self):
+        """ forget every client; like a replaced one, a client still in use is not closed under its callers """
+        with self.lock:
+            self.clients.clear()
 
+
+registry = ClientRegistry()
+
+
+def warmup(service, **kwargs):
+    """ build a provider's client and connect it, meant to run on a background thread at startup """
+    try:
+        registry.get(service, **kwargs).warmup()
+    except Exception as e:
+        log.warning("Warm-up of %s failed: %s", service, e)
+
+
+class RateLimitedService(RecognitionService):
+    """ Keep to the provider's request quota and retry throttling and transient errors with backoff """
+
+    def __init__(self, service, provider, retries=3):
+        self.service = service
+        self.provider = provider
+        self.retries = retries
+
+    def recognizeFormula(self, image_data, started=None, cancelled=None):
+        """ `started` is called once the first attempt has its token and goes to the provider,
+            setting the `cancelled` event ends the waits for a token or a retry
+        """
+        image_bytes = readImageBytes(image_data)
+        for attempt in range(self.retries + 1):
+            limiter = limiters.get(self.provider)
+            if not limiter.acquire(cancelled):
+                return {"status": False, "message": "Cancelled"}
+            if started is not None and attempt == 0:
+                started()
+            result = self.service.recognizeFormula(image_bytes)
+            if result.get('status') or not result.get('retryable') or attempt == self.retries:
+                return result
+            delay = retryDelay(attempt, result.get('retryAfter'))
+            if delay is None:
+                return result
+            limiter.drain()
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    return {"status": False, "message": "Cancelled"}
+            else:
+                time.sleep(delay)
+
+
+class CachedService(RecognitionService):
+    """ Answer repeated images from the result cache instead of calling the provider """
+
+    def __init__(self, service, provider, cache=resultCache):
+        self.service = service
+        self.provider = provider
+        self.cache = cache
+
+    def recognizeFormula(self, image_data, cancelled=None):
+        image_bytes = readImageBytes(image_data)
+        key = ResultCache.makeKey(image_bytes, self.provider)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        result = self.service.recognizeFormula(image_bytes, cancelled=cancelled)
+        if result.get('status'):
+            # a fallback's answer is kept under its own provider, the primary may read the formula differently
+            self.cache.put(ResultCache.makeKey(image_bytes, result.get('service', self.provider)), result)
+        return result
+
+
+class OCRClient:
+    def __init__(self, service, cache=resultCache, fallbacks=(), **kwargs):
+        """ `fallbacks` lists (service, credentials) of providers to hedge and fail over to """
+        self.service = service
+        self.client = self._get_client_instance(service, cache, fallbacks, **kwargs)
+
+    def _get_client_instance(self, service, cache, fallbacks, **kwargs):
+        client = RateLimitedService(registry.get(service, **kwargs), service)
+        if fallbacks:
+            from routing import HedgedRouter
+            client = HedgedRouter([(service, client)] +
+                                  [(name, RateLimitedService(registry.get(name, **options), name))
+                                   for name, options in fallbacks])
+        return CachedService(client, service, cache) if cache is not None else client
+
+    def recognizeText(self, image_data, cancelled=None):
+        """ `cancelled`, a threading.Event, stops the rate-limit and retry waits when it is set """
+        return self.toText(self.client.recognizeFormula(image_data, cancelled=cancelled))
+
+    @staticmethod
+    def toText(result):
         if result['status']:
             return {"status": True, "results": result['result']}
         else:
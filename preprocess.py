@@ -0,0 +1,97 @@
+from PyQt5.QtCore import Qt, QBuffer, QByteArray, QRect
+from PyQt5.QtGui import QImage, QPainter
+
+# longest side each provider needs, anything larger only costs upload time
+PROVIDER_MAX_SIDE = {
+    'API.SIMPLETEX': 1024,
+    'API.TENCENTCLOUD': 2048,
+    'API.ALIYUN': 2048,
+}
+DEFAULT_MAX_SIDE = 1024
+
+INK_THRESHOLD = 200  # gray levels darker than this count as content
+PADDING = 8
+MIN_MONO_HEIGHT = 32  # below this a 1-bit image loses too much of the glyph shapes
+
+INK_TABLE = bytes(1 if level < INK_THRESHOLD else 0 for level in range(256))
+
+
+def toGrayscale(image):
+    """ flatten transparency onto white and drop the color channels """
+    if image.hasAlphaChannel():
+        flattened = QImage(image.size(), QImage.Format_RGB32)
+        flattened.fill(Qt.white)
+        painter = QPainter(flattened)
+        painter.drawImage(0, 0, image)
+        painter.end()
+        image = flattened
+    return image.convertToFormat(QImage.Format_Grayscale8)
+
+
+def contentRect(gray):
+    """ bounding box of the pixels darker than `INK_THRESHOLD`, None for a blank image """
+    width, height = gray.width(), gray.height()
+    bytesPerLine = gray.bytesPerLine()
+    bits = gray.constBits()
+    bits.setsize(gray.sizeInBytes())
+    ink = bytes(bits).translate(INK_TABLE)
+
+    top = bottom = None
+    left, right = width, -1
+    for y in range(height):
+        row = ink[y * bytesPerLine:y * bytesPerLine + width]
+        first = row.find(1)
+        if first < 0:
+            continue
+        if top is None:
+            top = y
+        bottom = y
+        left = min(left, first)
+        right = max(right, row.rfind(1))
+
+    if top is None:
+        return None
+    return QRect(left, top, right - left + 1, bottom - top + 1)
+
+
+def encodePng(image):
+    byte_array = QByteArray()
+    buffer = QBuffer(byte_array)
+    buffer.open(QBuffer.WriteOnly)
+    image.save(buffer, 'PNG')
+    return byte_array.data()
+
+
+def encodeThumbnail(image_bytes, width=192, height=96):
+    """ the small copy of an upload kept in the history, twice the list's thumbnail size for high-DPI screens """
+    image = QImage.fromData(image_bytes)
+    if image.isNull():
+        return None
+    if image.width() > width or image.height() > height:
+        image = image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return encodePng(image)
+
+
+def preprocessImage(image, service=None):
+    """ crop, gray, downsample and encode `image` (QImage, file path or encoded bytes) as the smallest PNG """
+    if isinstance(image, str):
+        image = QImage(image)
+    elif isinstance(image, bytes):
+        image = QImage.fromData(image)
+    if image is None or image.isNull():
+        return None
+
+    gray = toGrayscale(image)
+    rect = contentRect(gray)
+    if rect is not None:
+        rect = rect.adjusted(-PADDING, -PADDING, PADDING, PADDING).intersected(gray.rect())
+        gray = gray.copy(rect)
+
+    maxSide = PROVIDER_MAX_SIDE.get(service, DEFAULT_MAX_SIDE)
+    if max(gray.width(), gray.height()) > maxSide:
+        gray = gray.scaled(maxSide, maxSide, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    candidates = [encodePng(gray)]
+    if gray.height() >= MIN_MONO_HEIGHT:
+        candidates.append(encodePng(gray.convertToFormat(QImage.Format_Mono, Qt.ThresholdDither)))
+    return min(candidates, key=len)
@@ -1,12 +1,199 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import latex2mathml.converter
+from PyQt5.QtCore import QTimer, pyqtSignal
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QAction, QApplication
 from qfluentwidgets import (FluentIcon, PlainTextEdit, DropDownPushButton, RoundMenu, HeaderCardWidget,
-                            isDarkTheme, InfoBar, PushButton)
+                            isDarkTheme, InfoBar, PushButton, SwitchButton, BodyLabel)
 from PyQt5.QtGui import QFont
 
 from config import cfg
+from history_store import history
+from render import MATHJAX_URL, renderer
+
+# shows formulas rendered to SVG by `renderer`, the page itself runs no MathJax;
+# each formula block is a node keyed by its hash, so unchanged blocks are never touched
+PREVIEW_SCRIPT = """
+            function showBlocks(keys) {
+                var container = document.getElementById('document');
+                var wanted = new Set(keys);
+                var nodes = {};
+                Array.prototype.slice.call(container.children).forEach(function (node) {
+                    if (wanted.has(node.dataset.key)) {
+                        nodes[node.dataset.key] = node;
+                    } else {
+                        container.removeChild(node);
+                    }
+                });
+                keys.forEach(function (key, i) {
+                    var node = nodes[key];
+                    if (!node) {
+                        node = document.createElement('div');
+                        node.className = 'block';
+                        node.dataset.key = key;
+                    }
+                    if (container.children[i] !== node) {
+                        container.insertBefore(node, container.children[i] || null);
+                    }
+                });
+            }
+
+            function setBlock(key, svg) {
+                var node = document.querySelector('[data-key="' + key + '"]');
+                if (node) {
+                    node.innerHTML = svg;
+                }
+            }
+
+            function setBlockText(key, text) {
+                var node = document.querySelector('[data-key="' + key + '"]');
+                if (node) {
+                    node.textContent = text;
+                }
+            }
+
+            function setStatus(text) {
+                document.getElementById('status').textContent = text;
+            }
+
+            function setTheme(background, text) {
+                var style = document.documentElement.style;
+                style.setProperty('--background-color', background);
+                style.setProperty('--text-color', text);
+            }
+"""
+
+
+def stripDelimiters(latex):
+    """ the TeX inside the $$ ... $$ the input card wraps around the user's text """
+    if len(latex) >= 4 and latex.startswith('$$') and latex.endswith('$$'):
+        return latex[2:-2]
+    return latex
+
+
+def splitBlocks(tex):
+    """ the formulas of a document, one per paragraph """
+    return [block.strip() for block in re.split(r'\n\s*\n', tex) if block.strip()]
+
+
+def buildHtml(body, background_color, text_color, script="", mathjax_url=MATHJAX_URL):
+    """ a standalone page, typeset by MathJax from `mathjax_url` when one is given """
+    mathjax = ""
+    if mathjax_url:
+        mathjax = f"""<script>
+            MathJax = {{
+                tex: {{
+                    inlineMath: [ ['$','$'], ["\\\\(","\\\\)"] ],
+                    displayMath: [ ['$$','$$'], ["\\\\[","\\\\]"] ],
+                    processEscapes: true,
+                    processEnvironments: true,
+                }},
+                chtml: {{
+                    displayAlign: "center",
+                }},
+                options: {{
+                    enableMenu: false
+                }}
+            }};
+            </script>
+            <script id="MathJax-script" async src="{mathjax_url}"></script>"""
+    return f"""
+        <html>
+        <head>
+            {mathjax}
+            <script>{script}</script>
+            <style>
+                :root {{
+                    --background-color: {background_color};
+                    --text-color: {text_color};
+                }}
+                body {{
+                    font-size: 25px; 
+                    background-color: var(--background-color); 
+                    color: var(--text-color); 
+                }}
+            </style>
+        </head>
+        <body>
+            {body}
+        </body>
+        </html>
+        """
+
+
+class ExportCache:
+    """ HTML and MathML of recent formulas, converted on a worker thread before the user copies them """
+
+    def __init__(self, maxEntries=64):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()  # tex -> future of {"colors", "html", "mathml", "error"}
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+    def prepare(self, blocks, colors):
+        """ queue the conversion of `blocks`, dropping queued ones for text the user has edited away """
+        wanted = set(blocks)
+        for tex, future in list(self.entries.items()):
+            if tex not in wanted and future.cancel():
+                del self.entries[tex]
+
+        for tex in blocks:
+            self.future(tex, colors)
+
+    def future(self, tex, colors):
+        """ the conversion of `tex`, queued now unless it already is """
+        future = self.entries.get(tex)
+        if future is None or future.cancelled():
+            future = self.entries[tex] = self.pool.submit(self._convert, tex, colors)
+        self.entries.move_to_end(tex)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return future
+
+    @staticmethod
+    def _convert(tex, colors):
+        try:
+            mathml, error = latex2mathml.converter.convert(tex), None
+        except Exception as e:
+            mathml, error = None, str(e) or type(e).__name__
+        return {"colors": colors, "html": buildHtml(f"<p>$${tex}$$</p>", *colors), "mathml": mathml,
+                "error": error}
+
+    def entry(self, tex, colors):
+        """ the finished conversion, None while the worker is still on it; the GUI thread never converts """
+        future = self.future(tex, colors)
+        return future.result() if future.done() else None
+
+    def whenDone(self, blocks, callback):
+        """ call `callback` as each conversion of `blocks` finishes, on the worker thread,
+            or straight away for one that has finished since the caller found it running
+        """
+        for tex in blocks:
+            future = self.entries.get(tex)
+            if future is not None:
+                future.add_done_callback(lambda _: callback())
+
+    def html(self, tex, colors):
+        entry = self.entry(tex, colors)
+        # only the colors depend on the theme, rebuilding the page for another theme is just formatting
+        if entry is not None and entry["colors"] == colors:
+            return entry["html"]
+        return buildHtml(f"<p>$${tex}$$</p>", *colors)
+
+    def mathml(self, tex, colors):
+        """ (MathML, None), (None, error) when latex2mathml cannot convert the formula,
+            or None while it is still being converted
+        """
+        entry = self.entry(tex, colors)
+        return None if entry is None else (entry["mathml"], entry["error"])
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 
 class PreviewInterface(QWidget):
@@ -22,7 +209,7 @@ class PreviewInterface(QWidget):
         cfg.themeChanged.connect(self.updateTheme)
 
     def updateTheme(self):
-        self.outputCard.updateLatex(self.outputCard.current_latex)
+        self.outputCard.applyTheme()
 
 class InputCard2(HeaderCardWidget):
     def __init__(self):
@@ -35,7 +222,21 @@ class InputCard2(HeaderCardWidget):
         self.editBox = PlainTextEdit()
         self.editBox.setFont(font)
 
-        self.editBox.textChanged.connect(self.updateLatexRender)
+        # document mode: every paragraph of the input is its own formula
+        self.documentLabel = BodyLabel(self.tr("Document mode"), self)
+        self.documentSwitch = SwitchButton(self)
+        self.documentSwitch.setChecked(cfg.previewDocumentMode.value)
+        self.documentSwitch.checkedChanged.connect(self.onDocumentModeChanged)
+        self.headerLayout.addStretch(1)
+        self.headerLayout.addWidget(self.documentLabel)
+        self.headerLayout.addWidget(self.documentSwitch)
+
+        # wait for a pause in typing before rendering
+        self.renderTimer = QTimer(self)
+        self.renderTimer.setSingleShot(True)
+        self.renderTimer.setInterval(150)
+        self.renderTimer.timeout.connect(self.updateLatexRender)
+        self.editBox.textChanged.connect(self.renderTimer.start)
 
         contentLayout.addWidget(self.editBox)
         self.viewLayout.addLayout(contentLayout)
@@ -45,23 +246,47 @@ class InputCard2(HeaderCardWidget):
         formatted_input = "$$" + user_input + "$$"
         self.parent().outputCard.updateLatex(formatted_input)
 
+    def onDocumentModeChanged(self, isChecked):
+        cfg.set(cfg.previewDocumentMode, isChecked)
+        self.parent().outputCard.setDocumentMode(isChecked)
+
 
 class OutputCard2(HeaderCardWidget):
+    exportsReady = pyqtSignal()  # a conversion a copy was waiting for has finished, emitted by the worker
+
     def __init__(self):
         super().__init__()
         self.current_latex = None
-        self.current_html = None
+        self.pendingMathML = None  # the blocks a MathML copy is waiting for
+        self.pageLoaded = False
+        self.documentMode = cfg.previewDocumentMode.value
+        self.blockTex = {}  # node key -> tex of the blocks on the page
+        self.shownBlocks = set()  # keys whose SVG is already in their node
+        self.recorded_latex = ()
         self.setTitle(self.tr("Output"))
         contentLayout = QVBoxLayout()
 
         # WebEngine
         self.webView = QWebEngineView(self)
         self.webView.setFixedHeight(230)
+        self.webView.loadFinished.connect(self.onPageLoaded)
+        renderer.rendered.connect(self.onFormulaRendered)
+        renderer.unavailable.connect(self.onRendererUnavailable)
         contentLayout.addWidget(self.webView)
+
+        # convert for the copy buttons once the user has paused editing
+        self.exports = ExportCache()
+        self.exportTimer = QTimer(self)
+        self.exportTimer.setSingleShot(True)
+        self.exportTimer.setInterval(400)
+        self.exportTimer.timeout.connect(self.prepareExports)
+        self.exportsReady.connect(self.onExportsReady)
+        QApplication.instance().aboutToQuit.connect(self.exports.shutdown)
         self.viewLayout.addLayout(contentLayout)
 
         # init latex
-        self.updateLatex("")
+        self.current_latex = ""
+        self.loadPage()
 
         buttonsLayout = QHBoxLayout()
         # buttons
@@ -101,89 +326,197 @@ class OutputCard2(HeaderCardWidget):
 
         self.viewLayout.addLayout(contentLayout)
 
-    def updateLatex(self, latex_code):
-        self.current_latex = latex_code
-
+    @staticmethod
+    def themeColors():
         background_color = "rgb(39, 39, 39)" if isDarkTheme() else "white"
         text_color = "white" if isDarkTheme() else "black"
+        return background_color, text_color
 
-        mathjax_url = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"
-        html_content = f"""
-        <html>
-        <head>
-            <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
-            <script id="MathJax-script" async src="{mathjax_url}"></script>
-            <script>
-            MathJax = {{
-                tex: {{
-                    inlineMath: [ ['$','$'], ["\\(","\\)"] ],
-                    displayMath: [ ['$$','$$'], ["\\[","\\]"] ],
-                    processEscapes: true,
-                    processEnvironments: true,
-                }},
-                chtml: {{
-                    displayAlign: "center",
-                }},
-                options: {{
-                    enableMenu: false
-                }},
-            }};
-            </script>
-            <style>
-                body {{
-                    font-size: 25px; 
-                    background-color: {background_color}; 
-                     color: {text_color}; 
-                }}
-            </style>
-        </head>
-        <body>
-            <p>{latex_code}</p>
-        </body>
-        </html>
-        """
-        self.current_html = html_content
+    def loadPage(self):
+        """ load the preview document once, later formulas are pushed into it with `updateLatex` """
+        self.pageLoaded = False
+        self.shownBlocks.clear()
+        html_content = buildHtml('<div id="status" style="font-size: 14px;"></div>'
+                                 '<div id="document" style="text-align: center;"></div>', *self.themeColors(),
+                                 PREVIEW_SCRIPT, mathjax_url=None)
         self.webView.setHtml(html_content)
 
+    def onPageLoaded(self, ok):
+        self.pageLoaded = ok
+        if ok:
+            # the theme may have changed while the page was loading
+            self.applyTheme()
+            if not renderer.available:
+                self.showUnavailable()
+            self.renderBlocks()
+
+    def applyTheme(self):
+        """ recolor the loaded page in place, the formulas draw with the page's text color """
+        if self.pageLoaded:
+            background_color, text_color = self.themeColors()
+            self.webView.page().runJavaScript(f"setTheme({json.dumps(background_color)}, {json.dumps(text_color)});")
+
+    def updateLatex(self, latex_code):
+        if latex_code == self.current_latex:
+            return
+
+        self.current_latex = latex_code
+        self.exportTimer.start()
+        if self.pageLoaded:
+            self.renderBlocks()
+
+    def setDocumentMode(self, enabled):
+        self.documentMode = enabled
+        self.exportTimer.start()
+        if self.pageLoaded:
+            self.renderBlocks()
+
+    def currentTex(self):
+        return stripDelimiters(self.current_latex).strip()
+
+    def blocks(self):
+        """ the formulas on display: the whole input, or each paragraph in document mode """
+        tex = self.currentTex()
+        if self.documentMode:
+            return splitBlocks(tex)
+        return [tex] if tex else []
+
+    def prepareExports(self):
+        self.exports.prepare(self.blocks(), self.themeColors())
+
+    def renderBlocks(self):
+        """ lay out one node per block; only blocks whose hash is new get an SVG pushed into them """
+        keys, occurrences = [], {}
+        blocks = self.blocks()
+        for tex in blocks:
+            digest = hashlib.sha1(tex.encode('utf-8')).hexdigest()[:16]
+            occurrences[digest] = occurrences.get(digest, 0) + 1
+            keys.append(f"{digest}-{occurrences[digest]}")
+
+        self.blockTex = dict(zip(keys, blocks))
+        self.shownBlocks &= set(keys)
+        renderer.discard(self)  # blocks edited away since the last pass need not be rendered any more
+        self.webView.page().runJavaScript(f"showBlocks({json.dumps(keys)});")
+        self.fillBlocks()
+
+    def fillBlocks(self, tex=None):
+        """ push cached SVGs into empty nodes, the others are filled by `onFormulaRendered` """
+        for key, block in self.blockTex.items():
+            if key in self.shownBlocks or (tex is not None and block != tex):
+                continue
+            svg = renderer.svg(block, self)
+            if svg is not None:
+                self.shownBlocks.add(key)
+                self.webView.page().runJavaScript(f"setBlock({json.dumps(key)}, {json.dumps(svg)});")
+            elif not renderer.available:
+                # nothing will render it, show the source rather than an empty preview
+                self.shownBlocks.add(key)
+                self.webView.page().runJavaScript(f"setBlockText({json.dumps(key)}, {json.dumps(block)});")
+
+    def onFormulaRendered(self, tex):
+        if self.pageLoaded:
+            self.fillBlocks(tex)
+
+    def onRendererUnavailable(self):
+        if self.pageLoaded:
+            self.showUnavailable()
+            self.fillBlocks()
+
+    def showUnavailable(self):
+        message = self.tr("MathJax could not be loaded, formulas are shown as LaTeX source.")
+        self.webView.page().runJavaScript(f"setStatus({json.dumps(message)});")
+
     def copyLatex(self, wrapper):
-        if not self.current_latex:
+        blocks = self.blocks()
+        if not blocks:
             self.warningMessage()
             return
 
-        latex = self.current_latex.strip('$')
-
-        if wrapper == '$ ... $':
-            wrapped_latex = f"${latex}$"
-        elif wrapper == '$$ ... $$':
-            wrapped_latex = f"$${latex}$$"
-        elif wrapper == '\\[ ... \\]':
-            wrapped_latex = f"\\[{latex}\\]"
-        elif wrapper == '\\( ... \\)':
-            wrapped_latex = f"\\({latex}\\)"
-        elif wrapper == '\\begin{equation} ... \\end{equation}':
-            wrapped_latex = f"\\begin{{equation}}{latex}\\end{{equation}}"
-        else:
-            wrapped_latex = latex
+        wrapped_blocks = []
+        for latex in blocks:
+            if wrapper == '$ ... $':
+                wrapped_latex = f"${latex}$"
+            elif wrapper == '$$ ... $$':
+                wrapped_latex = f"$${latex}$$"
+            elif wrapper == '\\[ ... \\]':
+                wrapped_latex = f"\\[{latex}\\]"
+            elif wrapper == '\\( ... \\)':
+                wrapped_latex = f"\\({latex}\\)"
+            elif wrapper == '\\begin{equation} ... \\end{equation}':
+                wrapped_latex = f"\\begin{{equation}}{latex}\\end{{equation}}"
+            else:
+                wrapped_latex = latex
+            wrapped_blocks.append(wrapped_latex)
         clipboard = QApplication.clipboard()
-        clipboard.setText(wrapped_latex)
+        clipboard.setText("\n\n".join(wrapped_blocks))
         self.successMessage("LaTeX")
+        self.recordHistory()
 
     def copyHtml(self):
-        if self.current_latex:
-            clipboard = QApplication.clipboard()
-            clipboard.setText(self.current_html)
-            self.successMessage("HTML")
-        else:
+        blocks = self.blocks()
+        if not blocks:
             self.warningMessage()
+            return
 
-    def copyMathML(self):
-        if self.current_latex:
-            mathml_code = latex2mathml.converter.convert(self.current_latex)
-            clipboard = QApplication.clipboard()
-            clipboard.setText(mathml_code)
-            self.successMessage("MathML")
+        colors = self.themeColors()
+        if len(blocks) == 1:
+            html = self.exports.html(blocks[0], colors)
         else:
+            html = buildHtml("".join(f"<p>$${tex}$$</p>" for tex in blocks), *colors)
+        clipboard = QApplication.clipboard()
+        clipboard.setText(html)
+        self.successMessage("HTML")
+        self.recordHistory()
+
+    def copyMathML(self):
+        blocks = self.blocks()
+        if not blocks:
             self.warningMessage()
+            return
+
+        colors = self.themeColors()
+        # drop queued work for text edited away since the last pause, so these blocks are converted next
+        self.exports.prepare(blocks, colors)
+        conversions = [self.exports.mathml(tex, colors) for tex in blocks]
+        if None in conversions:
+            # the worker is still converting, finish the copy when it is done instead of converting here
+            self.pendingMathML = tuple(blocks)
+            running = [tex for tex, conversion in zip(blocks, conversions) if conversion is None]
+            InfoBar.info(
+                title=self.tr("Not Ready Yet"),
+                content=self.tr("Still converting, the MathML is copied as soon as it is done."),
+                parent=self.parent()
+            ).show()
+            self.exports.whenDone(running, self.exportsReady.emit)
+            return
+
+        self.pendingMathML = None
+        errors = [error for _, error in conversions if error is not None]
+        if errors:
+            InfoBar.error(
+                title=self.tr("Conversion Failed"),
+                content=self.tr("This formula cannot be converted to MathML.") + "\n" + errors[0],
+                parent=self.parent()
+            ).show()
+            return
+        mathml_code = "\n".join(mathml for mathml, _ in conversions)
+        clipboard = QApplication.clipboard()
+        clipboard.setText(mathml_code)
+        self.successMessage("MathML")
+        self.recordHistory()
+
+    def onExportsReady(self):
+        # the text may have been edited since the copy was asked for, it then no longer applies
+        if self.pendingMathML is not None and self.pendingMathML == tuple(self.blocks()):
+            self.copyMathML()
+
+    def recordHistory(self):
+        """ a copied formula is one the user cares about, keep it in the history """
+        blocks = tuple(self.blocks())
+        for latex in blocks:
+            if latex not in self.recorded_latex:
+                history.add("Preview", latex)
+        self.recorded_latex = blocks
 
     def warningMessage(self):
         InfoBar.warning(
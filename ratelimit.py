@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# conservative defaults for each provider's request quota, requests per second
+PROVIDER_QPS = {
+    'API.SIMPLETEX': 2,
+    'API.TENCENTCLOUD': 10,
+    'API.ALIYUN': 10,
+}
+
+
+class TokenBucket:
+    """ Allow `rate` requests per second on average and bursts of up to `burst` """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """ take a token and return how many seconds to wait before using it """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, cancelled=None):
+        """ wait for a token, False when the `cancelled` event is set first """
+        delay = self.reserve()
+        if delay > 0:
+            if cancelled is not None:
+                return not cancelled.wait(delay)
+            time.sleep(delay)
+        return cancelled is None or not cancelled.is_set()
+
+    def drain(self):
+        """ the provider said we are too fast, spend the burst so callers slow down to `rate` """
+        with self.lock:
+            self.tokens = min(self.tokens, 0)
+
+
+class LimiterRegistry:
+    """ One bucket per provider, shared by every client in the process """
+
+    def __init__(self, quotas=PROVIDER_QPS):
+        self.quotas = dict(quotas)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get(self, service):
+        with self.lock:
+            bucket = self.buckets.get(service)
+            if bucket is None:
+                bucket = self.buckets[service] = TokenBucket(self.quotas.get(service, 5))
+            return bucket
+
+    def configure(self, service, rate, burst=None):
+        with self.lock:
+            self.quotas[service] = rate
+            self.buckets[service] = TokenBucket(rate, burst)
+
+    def update(self, quotas):
+        """ apply {service: rate}, a bucket is only replaced when its rate changes """
+        with self.lock:
+            for service, rate in quotas.items():
+                if self.quotas.get(service) != rate:
+                    self.quotas[service] = rate
+                    self.buckets.pop(service, None)
+
+
+limiters = LimiterRegistry()
+
+
+def backoffDelay(attempt, baseDelay=0.5, maxDelay=8.0):
+    """ full jitter: anywhere between 0 and the exponential bound, so retrying clients spread out """
+    return random.uniform(0, min(maxDelay, baseDelay * 2 ** attempt))
+
+
+def parseRetryAfter(value):
+    """ seconds from a Retry-After header, given either as a number of seconds or as an HTTP date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def retryDelay(attempt, retryAfter=None, maxRetryAfter=30.0):
+    """ the provider's Retry-After when it sent one, backoff otherwise;
+        None when the provider wants more time than is worth waiting for
+    """
+    if retryAfter is None:
+        return backoffDelay(attempt)
+    if retryAfter > maxRetryAfter:
+        return None
+    # a little jitter so clients told the same moment do not all come back at once
+    return retryAfter + backoffDelay(0)
@@ -1,13 +1,26 @@
-from PyQt5.QtCore import Qt, QByteArray, QBuffer, QTimer
+import os
+import threading
+import time
+
+from PyQt5.QtCore import Qt, QTimer, QPoint, QRect, pyqtSignal
 from PyQt5.QtWidgets import (QWidget, QStackedWidget, QHBoxLayout, QApplication,
-                             QVBoxLayout, QFileDialog)
+                             QVBoxLayout, QFileDialog, QTableWidgetItem, QHeaderView, QAbstractItemView)
 from qfluentwidgets import FluentIcon, SegmentedToggleToolWidget, PlainTextEdit, ImageLabel, \
-    BodyLabel, HeaderCardWidget, SimpleCardWidget, PushButton, PrimaryPushButton, InfoBar
-from PyQt5.QtGui import QPainter, QPen, QPixmap, QImage, QFont, QKeySequence
+    BodyLabel, HeaderCardWidget, SimpleCardWidget, PushButton, PrimaryPushButton, InfoBar, \
+    IndeterminateProgressBar, TableWidget, LineEdit
+from PyQt5.QtGui import QPainter, QPen, QPixmap, QImage, QFont, QKeySequence, QPolygon
 
+from batch import collectImages, exportResults
+from cache import imageHash
 from config import cfg
-from ocr_services import OCRClient
-from settings import decrypt_text
+from executor import RecognitionExecutor
+from history_store import history
+from metrics import metrics
+from ocr_services import OCRClient, resultToText, PROVIDER_NAMES, warmup
+from preprocess import encodeThumbnail, preprocessImage
+from ratelimit import limiters
+from settings import decrypt_text, fallbackProviders, providerQuotas
+from strokes import StrokeBuffer
 
 
 class RecognitionInterface(QWidget):
@@ -24,6 +37,16 @@ class RecognitionInterface(QWidget):
         self.setFocusPolicy(Qt.StrongFocus)
         QTimer.singleShot(0, self.input.uploadInterface.setFocus)
 
+        # recognition runs on a worker pool so the event loop never blocks on the network
+        self.executor = RecognitionExecutor(parent=self)
+        self.executor.jobStarted.connect(self.output.onJobStarted)
+        self.executor.jobFinished.connect(self.input.onRecognitionFinished)
+        self.executor.jobFailed.connect(self.input.onRecognitionFailed)
+        self.executor.jobCancelled.connect(self.output.finishJob)
+        self.executor.jobCancelled.connect(self.input.batchInterface.cancelJob)
+        self.output.cancelButton.clicked.connect(self.executor.cancelAll)
+        QApplication.instance().aboutToQuit.connect(self.executor.shutdown)
+
     def keyPressEvent(self, event):
         if event.matches(QKeySequence.Paste):
             self.pasteImageFromClipboard()
@@ -69,12 +92,15 @@ class InputCard1(HeaderCardWidget):
         self.uploadInterface.setFocus()
         self.uploadInterface.setFixedHeight(200)
         self.handwritingInterface = HandwritingBoard()
+        self.batchInterface = BatchBox()
 
         contentLayout = QVBoxLayout()
         buttonsLayout = QHBoxLayout()
 
         self.addSubInterface(self.uploadInterface, 'Upload File', FluentIcon.PHOTO)
         self.addSubInterface(self.handwritingInterface, 'Writing Pad', FluentIcon.PENCIL_INK)
+        self.addSubInterface(self.batchInterface, 'Batch', FluentIcon.FOLDER)
+        self.uploadInterface.filesDropped.connect(self.onFilesDropped)
 
         buttonsLayout.addWidget(self.pivot, 0, Qt.AlignCenter)
         contentLayout.addLayout(buttonsLayout)
@@ -118,48 +144,75 @@ class InputCard1(HeaderCardWidget):
             self.uploadInterface.clearContent()
         elif currentIndex == 1:  # HandwritingBoard
             self.handwritingInterface.clearContent()
+        elif currentIndex == 2:  # BatchBox
+            for jobId in list(self.batchInterface.jobs):
+                self.parent().executor.cancel(jobId)
+            self.batchInterface.clearContent()
+
+    def onFilesDropped(self, paths):
+        self.stackedWidget.setCurrentWidget(self.batchInterface)
+        self.batchInterface.addPaths(paths)
+
+    def createClient(self):
+        """ build the OCR client from the settings, or show why it cannot be built """
+        service = f"{cfg.apiService.value}"
+        access_key_id = cfg.apiId.value
+        access_key_secret = decrypt_text(cfg.apiKey.value)
+        if not access_key_id or not access_key_secret:
+            InfoBar.warning(
+                title=self.tr("API Info Required"),
+                content=self.tr("Please fill in valid API ID and Key in the settings."),
+                parent=self.parent()
+            ).show()
+            return None
+
+        limiters.update(providerQuotas())
+        try:
+            return OCRClient(service, fallbacks=fallbackProviders(), id=access_key_id, key=access_key_secret)
+        except ValueError as e:
+            InfoBar.error(
+                title='Error',
+                content=str(e),
+                parent=self.parent()
+            ).show()
+            return None
+
+    def warmUp(self):
+        """ build and connect the configured client in the background, so the first recognition is not slower;
+            fallbacks are only set up when a recognition needs them
+        """
+        access_key_id = cfg.apiId.value
+        access_key_secret = decrypt_text(cfg.apiKey.value)
+        if not access_key_id or not access_key_secret:
+            return
+
+        threading.Thread(target=warmup, args=(f"{cfg.apiService.value}",),
+                         kwargs={"id": access_key_id, "key": access_key_secret}, name="warmup", daemon=True).start()
 
     def recognizeContent(self):
-        self.parent().output.textEdit.clear()
         currentWidget = self.stackedWidget.currentWidget()
-        image_bytes = None
+        if isinstance(currentWidget, BatchBox):
+            self.recognizeBatch()
+            return
+
+        image = None
+        start = time.perf_counter()
         # at upload interface
         if isinstance(currentWidget, UploadBox):
-            image_bytes = currentWidget.getImageAsBytes()
+            image = currentWidget.getImage()
         # at handwriting interface
         elif isinstance(currentWidget, HandwritingBoard):
-            image_bytes = currentWidget.getDrawingAsBytes()
-
-        if image_bytes:
-            service = f"{cfg.apiService.value}"
-            access_key_id = cfg.apiId.value
-            access_key_secret = decrypt_text(cfg.apiKey.value)
-            if not access_key_id or not access_key_secret:
-                InfoBar.warning(
-                    title=self.tr("API Info Required"),
-                    content=self.tr("Please fill in valid API ID and Key in the settings."),
-                    parent=self.parent()
-                ).show()
+            image = currentWidget.getDrawingAsImage()
+        captureTime = time.perf_counter() - start
+
+        if image is not None:
+            ocr_client = self.createClient()
+            if ocr_client is None:
                 return
+            metrics.observe("capture", PROVIDER_NAMES.get(ocr_client.service, ocr_client.service), captureTime)
 
-            try:
-                ocr_client = OCRClient(service, id=access_key_id,
-                                       key=access_key_secret)
-                recognition_result = ocr_client.recognizeText(image_bytes)
-                if recognition_result['status']:
-                    self.parent().output.displayRecognitionResult(recognition_result)
-                else:
-                    InfoBar.error(
-                        title=self.tr("Recognition Failed"),
-                        content=self.tr("Please check the Network and API settings."),
-                        parent=self.parent()
-                    ).show()
-            except ValueError as e:
-                InfoBar.error(
-                    title='Error',
-                    content=str(e),
-                    parent=self.parent()
-                ).show()
+            jobId = self.parent().executor.submit(self.recognizeImage, ocr_client, image)
+            self.parent().output.startJob(jobId)
         else:
             InfoBar.warning(
                 title=self.tr("Empty"),
@@ -167,8 +220,71 @@ class InputCard1(HeaderCardWidget):
                 parent=self.parent()
             ).show()
 
+    def recognizeBatch(self):
+        paths = self.batchInterface.pendingPaths()
+        if not paths:
+            InfoBar.warning(
+                title=self.tr("Empty"),
+                content=self.tr("No content to recognize."),
+                parent=self.parent()
+            ).show()
+            return
+
+        ocr_client = self.createClient()
+        if ocr_client is None:
+            return
+
+        # the executor's pool bounds how many requests are in flight at once
+        for path in paths:
+            jobId = self.parent().executor.submit(self.recognizeImage, ocr_client, path)
+            self.batchInterface.setJob(path, jobId)
+            self.parent().output.startJob(jobId)
+
+    @staticmethod
+    def recognizeImage(ocr_client, image, cancelled=None):
+        """ runs on the worker pool: shrink the image for the provider, then recognize it """
+        provider = PROVIDER_NAMES.get(ocr_client.service, ocr_client.service)
+        start = time.perf_counter()
+        with metrics.timer("encode", provider):
+            image_bytes = preprocessImage(image, ocr_client.service)
+        if image_bytes is None:
+            raise ValueError("Could not load the image.")
+        recognition_result = dict(ocr_client.recognizeText(image_bytes, cancelled), provider=provider)
+        latency = time.perf_counter() - start
+        metrics.observe("total", provider, latency)
+        metrics.countOutcome(provider, recognition_result['status'])
+        if recognition_result['status']:
+            history.add(provider, resultToText(recognition_result), imageHash(image_bytes), latency,
+                        image=encodeThumbnail(image_bytes))
+        return recognition_result
+
+    def onRecognitionFinished(self, jobId, recognition_result):
+        output = self.parent().output
+        output.finishJob(jobId)
+        if self.batchInterface.hasJob(jobId):
+            self.batchInterface.setResult(jobId, recognition_result)
+            return
+        if recognition_result['status']:
+            with metrics.timer("display", recognition_result.get('provider', '')):
+                output.displayRecognitionResult(recognition_result)
+        else:
+            self.onRecognitionFailed(jobId, recognition_result.get('message', ''))
+
+    def onRecognitionFailed(self, jobId, message):
+        self.parent().output.finishJob(jobId)
+        if self.batchInterface.hasJob(jobId):
+            self.batchInterface.setResult(jobId, {"status": False, "message": message})
+            return
+        InfoBar.error(
+            title=self.tr("Recognition Failed"),
+            content=self.tr("Please check the Network and API settings."),
+            parent=self.parent()
+        ).show()
+
 
 class UploadBox(SimpleCardWidget):
+    filesDropped = pyqtSignal(list)
+
     def __init__(self, parent=None):
         super(UploadBox, self).__init__(parent)
         self.setAcceptDrops(True)
@@ -200,8 +316,13 @@ class UploadBox(SimpleCardWidget):
         if mimeData.hasImage():
             self.currentImage = mimeData.imageData()
         elif mimeData.hasUrls():
-            url = mimeData.urls()[0].toLocalFile()
-            self.currentImage = QImage(url)
+            paths = [url.toLocalFile() for url in mimeData.urls()]
+            if len(paths) > 1 or os.path.isdir(paths[0]):
+                # several files or a folder go to batch mode
+                self.filesDropped.emit(paths)
+                event.accept()
+                return
+            self.currentImage = QImage(paths[0])
         if self.currentImage and not self.currentImage.isNull():
             self.switchToImageLabel(QPixmap.fromImage(self.currentImage))
         event.accept()
@@ -255,83 +376,253 @@ class UploadBox(SimpleCardWidget):
         self.textLabel.setVisible(True)
         self.imageLabel.setVisible(False)
 
-    def getImageAsBytes(self):
-        # transform current image to QByteArray
+    def getImage(self):
         if self.currentImage is None or self.currentImage.isNull():
             return None  # invalid image
-
-        byte_array = QByteArray()
-        buffer = QBuffer(byte_array)
-        buffer.open(QBuffer.WriteOnly)
-        self.currentImage.save(buffer, 'PNG')
-        return byte_array.data()
+        return self.currentImage.copy()
 
 
 class HandwritingBoard(SimpleCardWidget):
     def __init__(self):
         super().__init__()
-        self.path = []
+        self.strokes = StrokeBuffer()
         self.last_point = None
         self.setMouseTracking(True)
         self.total_drawn_length = 0  # total length of drawn path
+        self.pen = QPen(Qt.black, 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+        self.canvas = self.createCanvas()  # finished strokes, painted once per segment
+
+    def createCanvas(self):
+        ratio = self.devicePixelRatioF()
+        canvas = QImage(self.size() * ratio, QImage.Format_ARGB32_Premultiplied)
+        canvas.setDevicePixelRatio(ratio)
+        canvas.fill(Qt.transparent)
+        return canvas
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.canvas = self.createCanvas()
+        painter = QPainter(self.canvas)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.draw(painter)
+        painter.end()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.last_point = event.pos()
-            self.path.append([self.last_point])
+            self.strokes.startStroke(self.last_point.x(), self.last_point.y())
 
     def mouseMoveEvent(self, event):
         if event.buttons() & Qt.LeftButton and self.last_point is not None:
             new_point = event.pos()
-            self.path[-1].append(new_point)
+            if not self.strokes.addPoint(new_point.x(), new_point.y()):
+                return
             self.total_drawn_length += (new_point - self.last_point).manhattanLength()
+            self.drawSegment(self.last_point, new_point)
             self.last_point = new_point
-            self.update()
 
     def mouseReleaseEvent(self, event):
+        if self.last_point is not None:
+            self.strokes.endStroke()
         self.last_point = None
 
+    def drawSegment(self, start, end):
+        painter = QPainter(self.canvas)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(self.pen)
+        painter.drawLine(start, end)
+        painter.end()
+
+        # repaint only the area the new segment touches
+        margin = self.pen.width()
+        self.update(QRect(start, end).normalized().adjusted(-margin, -margin, margin, margin))
+
     def paintEvent(self, event):
         super().paintEvent(event)  # call the paintEvent of SimpleCardWidget
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-
-        # draw path
-        painter.setPen(QPen(Qt.black, 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-        for segment in self.path:
-            if len(segment) > 1:
-                for i in range(len(segment) - 1):
-                    painter.drawLine(segment[i], segment[i + 1])
+        painter.setClipRect(event.rect())
+        painter.drawImage(0, 0, self.canvas)
 
     def draw(self, painter):
-        painter.setPen(QPen(Qt.black, 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-        for segment in self.path:
-            for i in range(1, len(segment)):
-                painter.drawLine(segment[i - 1], segment[i])
+        painter.setPen(self.pen)
+        for xs, ys in self.strokes.strokes():
+            if len(xs) > 1:
+                painter.drawPolyline(QPolygon([QPoint(x, y) for x, y in zip(xs, ys)]))
 
-    def getDrawingAsBytes(self):
-        if not self.path or self.total_drawn_length < 10:
+    def getDrawingAsImage(self):
+        if not self.strokes or self.total_drawn_length < 10:
             return None
 
-        image = QImage(self.size(), QImage.Format_ARGB32)
+        image = QImage(self.canvas.size(), QImage.Format_RGB32)
+        image.setDevicePixelRatio(self.canvas.devicePixelRatio())
         image.fill(Qt.white)
 
         painter = QPainter(image)
-        self.draw(painter)
+        painter.drawImage(0, 0, self.canvas)
         painter.end()
-
-        buffer = QBuffer()
-        buffer.open(QBuffer.WriteOnly)
-        image.save(buffer, "PNG")
-
-        return bytes(buffer.data())
+        return image
 
     def clearContent(self):
-        self.path = []
+        self.strokes.clear()
         self.total_drawn_length = 0
+        self.canvas.fill(Qt.transparent)
         self.update()
 
 
+class BatchBox(SimpleCardWidget):
+    """ Many images recognized in one go, results stream into the table as they arrive """
+
+    PATH, STATUS, LATEX = range(3)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAcceptDrops(True)
+        self.paths = []
+        self.results = {}  # path -> latex
+        self.jobs = {}  # job id -> path
+        self.initUI()
+
+    def initUI(self):
+        self.patternEdit = LineEdit(self)
+        self.patternEdit.setPlaceholderText(self.tr("Folder or glob pattern, e.g. notes/**/*.png"))
+        self.patternEdit.setClearButtonEnabled(True)
+        self.addFilesButton = PushButton(FluentIcon.ADD, self.tr("Add Files"), self)
+        self.addFolderButton = PushButton(FluentIcon.FOLDER_ADD, self.tr("Add Folder"), self)
+        self.exportButton = PushButton(FluentIcon.SAVE, self.tr("Export"), self)
+
+        self.table = TableWidget(self)
+        self.table.setColumnCount(3)
+        self.table.setHorizontalHeaderLabels([self.tr("File"), self.tr("Status"), "LaTeX"])
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(self.LATEX, QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setFixedHeight(200)
+
+        toolsLayout = QHBoxLayout()
+        toolsLayout.addWidget(self.patternEdit, 1)
+        toolsLayout.addWidget(self.addFilesButton)
+        toolsLayout.addWidget(self.addFolderButton)
+        toolsLayout.addWidget(self.exportButton)
+
+        layout = QVBoxLayout()
+        layout.addLayout(toolsLayout)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        self.patternEdit.returnPressed.connect(self.addPattern)
+        self.addFilesButton.clicked.connect(self.chooseFiles)
+        self.addFolderButton.clicked.connect(self.chooseFolder)
+        self.exportButton.clicked.connect(self.exportTable)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.accept()
+        else:
+            event.ignore()
+
+    def dropEvent(self, event):
+        self.addPaths([url.toLocalFile() for url in event.mimeData().urls()])
+        event.accept()
+
+    def addPattern(self):
+        pattern = self.patternEdit.text().strip()
+        if pattern:
+            self.addPaths([pattern])
+            self.patternEdit.clear()
+
+    def chooseFiles(self):
+        fileNames, _ = QFileDialog.getOpenFileNames(self, self.tr("Open Images"), "",
+                                                    self.tr("Image Files (*.png *.jpg *.bmp)"))
+        self.addPaths(fileNames)
+
+    def chooseFolder(self):
+        folder = QFileDialog.getExistingDirectory(self, self.tr("Open Folder"))
+        if folder:
+            self.addPaths([folder])
+
+    def addPaths(self, paths):
+        images = [path for path in collectImages(paths) if path not in self.paths]
+        if not images and paths:
+            InfoBar.warning(
+                title=self.tr("Empty"),
+                content=self.tr("No new images found."),
+                parent=self.parent()
+            ).show()
+
+        for path in images:
+            row = len(self.paths)
+            self.paths.append(path)
+            self.table.insertRow(row)
+            self.table.setItem(row, self.PATH, QTableWidgetItem(os.path.basename(path)))
+            self.table.item(row, self.PATH).setToolTip(path)
+            self.table.setItem(row, self.STATUS, QTableWidgetItem(self.tr("Pending")))
+            self.table.setItem(row, self.LATEX, QTableWidgetItem(""))
+
+    def pendingPaths(self):
+        running = set(self.jobs.values())
+        return [path for path in self.paths if path not in self.results and path not in running]
+
+    def hasJob(self, jobId):
+        return jobId in self.jobs
+
+    def setJob(self, path, jobId):
+        self.jobs[jobId] = path
+        self.setStatus(path, self.tr("Queued"))
+
+    def setStatus(self, path, status):
+        self.table.item(self.paths.index(path), self.STATUS).setText(status)
+
+    def setResult(self, jobId, recognition_result):
+        path = self.jobs.pop(jobId)
+        row = self.paths.index(path)
+        if recognition_result['status']:
+            latex = resultToText(recognition_result)
+            self.results[path] = latex
+            self.table.item(row, self.STATUS).setText(self.tr("Done"))
+            self.table.item(row, self.LATEX).setText(latex)
+        else:
+            self.table.item(row, self.STATUS).setText(self.tr("Failed"))
+            self.table.item(row, self.STATUS).setToolTip(recognition_result.get('message', ''))
+
+    def cancelJob(self, jobId):
+        path = self.jobs.pop(jobId, None)
+        if path is not None:
+            self.setStatus(path, self.tr("Pending"))
+
+    def exportTable(self):
+        entries = [(path, self.results[path]) for path in self.paths if path in self.results]
+        if not entries:
+            InfoBar.warning(
+                title=self.tr("Empty"),
+                content=self.tr("No results to export."),
+                parent=self.parent()
+            ).show()
+            return
+
+        fileName, selectedFilter = QFileDialog.getSaveFileName(self, self.tr("Export Results"), "formulas.tex",
+                                                               self.tr("LaTeX Files (*.tex);;CSV Files (*.csv)"))
+        if not fileName:
+            return
+        # the format follows the chosen filter, a name typed without an extension gets the filter's one
+        extension = '.csv' if '*.csv' in selectedFilter else '.tex'
+        if not fileName.lower().endswith(extension):
+            fileName += extension
+        try:
+            exportResults(entries, fileName)
+        except OSError as e:
+            InfoBar.error(
+                title=self.tr("Export Failed"),
+                content=str(e),
+                parent=self.parent()
+            ).show()
+
+    def clearContent(self):
+        self.paths = []
+        self.results = {}
+        self.jobs = {}
+        self.table.setRowCount(0)
+
+
 class OutputCard1(HeaderCardWidget):
     def __init__(self):
         super().__init__()
@@ -346,30 +637,61 @@ class OutputCard1(HeaderCardWidget):
         self.textEdit.setFont(font)
         contentLayout.addWidget(self.textEdit)
 
+        # progress of queued / in-flight recognitions
+        self.pendingJobs = set()
+        self.runningJobs = set()  # the pending jobs a worker has picked up
+        self.progressBar = IndeterminateProgressBar(self, start=False)
+        self.progressBar.setVisible(False)
+        self.statusLabel = BodyLabel(self)
+        self.statusLabel.setVisible(False)
+        contentLayout.addWidget(self.progressBar)
+        contentLayout.addWidget(self.statusLabel, 0, Qt.AlignCenter)
+
         self.copyButton = PushButton(FluentIcon.COPY, self.tr("Copy"))
         self.copyButton.setFixedWidth(150)
         self.copyButton.clicked.connect(self.copyResult)
+        self.cancelButton = PushButton(FluentIcon.CANCEL, self.tr("Cancel"))
+        self.cancelButton.setFixedWidth(150)
+        self.cancelButton.setVisible(False)
         buttonLayout = QHBoxLayout()
         buttonLayout.addWidget(self.copyButton, 0, Qt.AlignCenter)
+        buttonLayout.addWidget(self.cancelButton, 0, Qt.AlignCenter)
 
         contentLayout.addLayout(buttonLayout)
 
         self.viewLayout.addLayout(contentLayout)
 
-    def displayRecognitionResult(self, recognition_result):
-        results = recognition_result.get('results', [])
-        detected_texts = []  # store all detected texts
-
-        for result in results:
-            if isinstance(result, dict):  # check if the result is a dict
-                text = result.get('DetectedText', '')
-                detected_texts.append(text)
-            elif isinstance(result, str):  # check if the result is a string
-                detected_texts.append(result)
-
-        result_text = "\n".join(detected_texts)
+    def startJob(self, jobId):
+        if not self.pendingJobs:
+            self.textEdit.clear()
+        self.pendingJobs.add(jobId)
+        self.updateProgress()
+
+    def onJobStarted(self, jobId):
+        # queued from the worker, the job may have been cancelled or finished in the meantime
+        if jobId in self.pendingJobs:
+            self.runningJobs.add(jobId)
+            self.updateProgress()
+
+    def finishJob(self, jobId):
+        self.pendingJobs.discard(jobId)
+        self.runningJobs.discard(jobId)
+        self.updateProgress()
+
+    def updateProgress(self):
+        busy = bool(self.pendingJobs)
+        if busy:
+            self.progressBar.start()
+            self.statusLabel.setText(self.tr("Recognizing {running}, {queued} queued").format(
+                running=len(self.runningJobs), queued=len(self.pendingJobs) - len(self.runningJobs)))
+        else:
+            self.progressBar.stop()
+        self.progressBar.setVisible(busy)
+        self.statusLabel.setVisible(busy)
+        self.cancelButton.setVisible(busy)
 
-        self.textEdit.setPlainText(result_text)
+    def displayRecognitionResult(self, recognition_result):
+        self.textEdit.setPlainText(resultToText(recognition_result))
 
     def copyResult(self):
         text = self.textEdit.toPlainText()
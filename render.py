@@ -0,0 +1,188 @@
+import json
+import os
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QObject, QTimer, QUrl, QByteArray, QRectF, pyqtSignal
+from PyQt5.QtGui import QPixmap, QPainter
+from PyQt5.QtSvg import QSvgRenderer
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+
+MATHJAX_URL = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"
+MATHJAX_SVG_URL = "https://cdn.jsdelivr.net/npm/mathjax@3.2.2/es5/tex-svg-full.js"
+# MathJax 3.2.2 with every TeX extension built in, shipped with the app so the renderer works offline
+MATHJAX_DIR = os.path.join('resource', 'mathjax')
+MATHJAX_SVG_LOCAL = 'mathjax/tex-svg-full.js'
+
+# converts one formula at a time; the SVG draws with currentColor so the host page decides the theme
+RENDERER_HTML = """
+<html>
+<head>
+    <script>
+    MathJax = {
+        svg: { fontCache: 'local' },
+        options: { enableMenu: false },
+        startup: { typeset: false }
+    };
+
+    function renderSvg(tex, display) {
+        if (!window.MathJax || !MathJax.tex2svg) {
+            return { loading: true };
+        }
+        try {
+            var node = MathJax.tex2svg(tex, { display: display });
+            return { svg: node.querySelector('svg').outerHTML };
+        } catch (err) {
+            // an extension the formula needs is still loading
+            return err.retry ? { retry: true } : { error: err.message };
+        }
+    }
+    </script>
+    <script src="%s"></script>
+</head>
+<body></body>
+</html>
+"""
+
+
+def localMathJaxAvailable():
+    return os.path.isfile(os.path.join(MATHJAX_DIR, 'tex-svg-full.js'))
+
+
+def svgToPixmap(svg, size, color):
+    """ rasterize a rendered formula into `size`, keeping its aspect ratio """
+    renderer = QSvgRenderer(QByteArray(svg.replace('currentColor', color).encode('utf-8')))
+    pixmap = QPixmap(size)
+    pixmap.fill(Qt.transparent)
+    box = renderer.viewBoxF()
+    if not renderer.isValid() or box.width() <= 0 or box.height() <= 0:
+        return pixmap
+
+    scale = min(size.width() / box.width(), size.height() / box.height())
+    width, height = box.width() * scale, box.height() * scale
+    painter = QPainter(pixmap)
+    renderer.render(painter, QRectF((size.width() - width) / 2, (size.height() - height) / 2, width, height))
+    painter.end()
+    return pixmap
+
+
+class FormulaRenderer(QObject):
+    """ TeX to SVG on one hidden, persistent MathJax page, with the results kept in a bounded cache """
+
+    rendered = pyqtSignal(str)  # the TeX whose SVG just entered the cache
+    unavailable = pyqtSignal()  # MathJax could not be loaded, nothing more will be rendered
+
+    MAX_RETRIES = 40
+    MAX_LOAD_POLLS = 40  # 10 s for the MathJax script to start on a loaded page
+    MAX_PAGE_LOADS = 3
+
+    def __init__(self, maxEntries=512, parent=None):
+        super().__init__(parent=parent)
+        self.maxEntries = maxEntries
+        self.cache = OrderedDict()  # tex -> svg
+        self.failed = OrderedDict()  # tex -> MathJax's error, the formulas it cannot parse
+        self.queue = OrderedDict()  # tex -> the owners still waiting for it
+        self.current = None
+        self.page = None
+        self.ready = False
+        self.available = True
+        self.retries = 0
+        self.loadPolls = 0
+        self.pageLoads = 0
+
+    def svg(self, tex, owner=None):
+        """ the cached SVG, or None while it is rendered in the background """
+        svg = self.cache.get(tex)
+        if svg is not None:
+            self.cache.move_to_end(tex)
+            return svg
+
+        if self.available and tex not in self.failed:
+            self.queue.setdefault(tex, set()).add(owner)
+            self.renderNext()
+        return None
+
+    def discard(self, owner):
+        """ forget the formulas `owner` asked for but no longer shows, unless someone else still wants them """
+        for tex, owners in list(self.queue.items()):
+            owners.discard(owner)
+            if not owners and tex != self.current:
+                del self.queue[tex]
+
+    def ensurePage(self):
+        if self.page is not None:
+            return
+        self.pageLoads += 1
+        self.loadPolls = 0
+        if localMathJaxAvailable():
+            url, baseUrl = MATHJAX_SVG_LOCAL, QUrl.fromLocalFile(os.path.abspath('resource') + os.sep)
+        else:
+            url, baseUrl = MATHJAX_SVG_URL, QUrl()
+        self.page = QWebEnginePage(self)
+        self.page.loadFinished.connect(self.onPageLoaded)
+        self.page.setHtml(RENDERER_HTML % url, baseUrl)
+
+    def onPageLoaded(self, ok):
+        if not ok:
+            self.reloadPage()
+            return
+        self.ready = True
+        self.renderNext()
+
+    def reloadPage(self):
+        """ start over on a new page, or give up once the page has failed to load MathJax too often """
+        self.ready = False
+        self.current = None
+        if self.page is not None:
+            self.page.deleteLater()
+            self.page = None
+        if self.pageLoads < self.MAX_PAGE_LOADS:
+            QTimer.singleShot(1000, self.renderNext)
+            return
+
+        self.available = False
+        self.queue.clear()
+        self.unavailable.emit()
+
+    def renderNext(self):
+        if not self.available:
+            return
+        self.ensurePage()
+        if self.current is not None or not self.ready or not self.queue:
+            return
+        tex = self.current = next(iter(self.queue))
+        self.page.runJavaScript(f"renderSvg({json.dumps(tex)}, true);", lambda result: self.onRendered(tex, result))
+
+    def onRendered(self, tex, result):
+        self.current = None
+        result = result or {"loading": True}
+        if result.get("loading"):
+            # the MathJax script is still starting, which says nothing about this formula
+            self.loadPolls += 1
+            if self.loadPolls < self.MAX_LOAD_POLLS:
+                QTimer.singleShot(250, self.renderNext)
+            else:
+                self.reloadPage()
+            return
+        if result.get("retry") and self.retries < self.MAX_RETRIES:
+            # MathJax is fetching an extension, ask again shortly
+            self.retries += 1
+            QTimer.singleShot(50, self.renderNext)
+            return
+
+        self.retries = 0
+        self.queue.pop(tex, None)
+        svg = result.get("svg")
+        if svg:
+            self.cache[tex] = svg
+            while len(self.cache) > self.maxEntries:
+                self.cache.popitem(last=False)
+            self.rendered.emit(tex)
+        elif result.get("error"):
+            # only a parse error is permanent, a formula that ran out of retries may be asked for again
+            self.failed[tex] = result["error"]
+            while len(self.failed) > self.maxEntries:
+                self.failed.popitem(last=False)
+        self.renderNext()
+
+
+renderer = FormulaRenderer()
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from ocr_services import RateLimitedService, RecognitionService
+
+
+class ProviderHealth:
+    """ Recent latencies and failures of one provider """
+
+    def __init__(self, samples=100, maxFailures=3, cooldown=60):
+        self.latencies = deque(maxlen=samples)
+        self.maxFailures = maxFailures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.unhealthyUntil = 0
+        self.lock = threading.Lock()
+
+    def record(self, success, latency):
+        with self.lock:
+            if success:
+                self.latencies.append(latency)
+                self.failures = 0
+                self.unhealthyUntil = 0
+            else:
+                self.failures += 1
+                if self.failures >= self.maxFailures:
+                    self.unhealthyUntil = time.monotonic() + self.cooldown
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthyUntil
+
+    def percentile(self, fraction):
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if len(ordered) < 10:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# shared by every router so what one recognition learns about a provider carries over to the next
+providerHealth = {}
+healthLock = threading.Lock()
+
+
+def getHealth(service):
+    with healthLock:
+        return providerHealth.setdefault(service, ProviderHealth())
+
+
+class Attempt:
+    """ One request to one provider, its clock starts once it has a worker and a rate-limit token """
+
+    def __init__(self, hedgeDelay):
+        self.hedgeDelay = hedgeDelay
+        self.startedAt = None
+
+    def start(self):
+        self.startedAt = time.monotonic()
+
+    def elapsed(self):
+        return 0 if self.startedAt is None else time.monotonic() - self.startedAt
+
+    def untilHedge(self):
+        """ seconds left before a hedge is due, None while the request has not started """
+        if self.startedAt is None:
+            return None
+        return max(0, self.startedAt + self.hedgeDelay - time.monotonic())
+
+
+class HedgedRouter(RecognitionService):
+    """ Ask the primary provider first, hedge to the next one when it is slower than its usual
+        latency percentile, and fail over straight away when it errors
+    """
+
+    pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+    POLL_INTERVAL = 0.05  # while the newest request waits for a worker or a token
+
+    def __init__(self, services, percentile=0.9, defaultDelay=2.0, minDelay=0.3):
+        self.services = services  # [(service name, RecognitionService)], primary first
+        self.percentile = percentile
+        self.defaultDelay = defaultDelay
+        self.minDelay = minDelay
+
+    def hedgeDelay(self, service):
+        latency = getHealth(service).percentile(self.percentile)
+        return self.defaultDelay if latency is None else max(self.minDelay, latency)
+
+    def candidates(self):
+        """ healthy providers in configured order, unhealthy ones only as a last resort """
+        healthy = [entry for entry in self.services if getHealth(entry[0]).healthy()]
+        return healthy + [entry for entry in self.services if entry not in healthy]
+
+    def _call(self, name, service, image_data, attempt, cancelled):
+        try:
+            if isinstance(service, RateLimitedService):
+                result = service.recognizeFormula(image_data, started=attempt.start, cancelled=cancelled)
+            else:
+                attempt.start()
+                result = service.recognizeFormula(image_data)
+        except Exception as e:
+            result = {"status": False, "message": str(e) or type(e).__name__}
+        getHealth(name).record(result.get("status", False), attempt.elapsed())
+        # the service that answered, so the result is cached under its key and not the primary's
+        return dict(result, service=name)
+
+    def recognizeFormula(self, image_data, cancelled=None):
+        pending = {}
+        waiting = self.candidates()
+        result = {"status": False, "message": "No provider available"}
+        latest, failed = None, False
+
+        while waiting or pending:
+            if cancelled is not None and cancelled.is_set():
+                return {"status": False, "message": "Cancelled"}
+            if waiting and (not pending or (len(pending) < 2 and (failed or latest.untilHedge() == 0))):
+                name, service = waiting.pop(0)
+                latest, failed = Attempt(self.hedgeDelay(name)), False
+                pending[self.pool.submit(self._call, name, service, image_data, latest, cancelled)] = name
+
+            timeout = None
+            if waiting and len(pending) < 2:
+                timeout = latest.untilHedge()
+                if timeout is None:
+                    timeout = self.POLL_INTERVAL
+            elif cancelled is not None:
+                timeout = self.POLL_INTERVAL
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                result = future.result()
+                if result.get("status"):
+                    # a slower request still running finishes in the background and only updates the stats
+                    return result
+                failed = True
+        return result
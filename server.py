@@ -0,0 +1,202 @@
+""" Local recognition daemon shared by editors and scripts: `python server.py --port 8765`
+
+    POST /recognize   body: the image bytes          -> {"status", "latex" | "message", "latency"}
+    GET  /stats       queue depth, deduplication and latency figures
+    GET  /metrics     per-stage timing histograms in the Prometheus text format
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from cache import ResultCache, resultCache
+from cli import (CONFIG_FILE, SERVICES, loadFallbacks, loadQuotas, quotaArg, resolveApiSettings,
+                 useInstallResources)
+from metrics import metrics
+from ocr_services import OCRClient, PROVIDER_NAMES, resultToText, warmup
+from ratelimit import limiters
+
+MAX_BODY_SIZE = 20 * 1024 * 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RecognitionDispatcher:
+    """ Run requests on a worker pool, sending an image that is already being recognized only once
+
+        Requests are not held back to be grouped: none of the providers takes several images in one call,
+        so a batch would still be one request per image, only sent later. What grouping would save, sending
+        a repeated image once, comes from sharing the in-flight request here and from the result cache
+        once it has finished.
+    """
+
+    def __init__(self, ocr_client, maxWorkers=4):
+        self.ocr_client = ocr_client
+        self.pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="recognition")
+        self.lock = threading.Lock()
+        self.queued = 0  # submitted to the pool, not started yet
+        self.inFlight = {}  # key -> future shared by every request for that image
+        self.latencies = deque(maxlen=1024)
+        self.counters = {"requests": 0, "deduplicated": 0, "dispatched": 0, "failed": 0}
+
+    def submit(self, image_bytes):
+        key = ResultCache.makeKey(image_bytes, self.ocr_client.service)
+        with self.lock:
+            self.counters["requests"] += 1
+            future = self.inFlight.get(key)
+            if future is not None:
+                self.counters["deduplicated"] += 1
+                return future
+
+            future = Future()
+            self.inFlight[key] = future
+            self.queued += 1
+            self.counters["dispatched"] += 1
+        self.pool.submit(self._recognize, key, image_bytes, future)
+        return future
+
+    def _recognize(self, key, image_bytes, future):
+        with self.lock:
+            self.queued -= 1
+        start = time.perf_counter()
+        try:
+            result = dict(self.ocr_client.recognizeText(image_bytes))
+        except Exception as e:
+            result = {"status": False, "message": str(e) or type(e).__name__}
+        result["latency"] = time.perf_counter() - start
+        provider = PROVIDER_NAMES.get(self.ocr_client.service, self.ocr_client.service)
+        metrics.observe("total", provider, result["latency"])
+        metrics.countOutcome(provider, result["status"])
+
+        with self.lock:
+            self.inFlight.pop(key, None)
+            self.latencies.append(result["latency"])
+            if not result["status"]:
+                self.counters["failed"] += 1
+        future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            stats = dict(self.counters)
+            stats["queueDepth"] = self.queued
+            stats["inFlight"] = len(self.inFlight)
+        stats["latency"] = {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "samples": len(latencies),
+        }
+        stats["cache"] = resultCache.stats()
+        return stats
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    server_version = "Formulite"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/stats":
+            self.sendJson(200, self.server.dispatcher.stats())
+        elif path == "/metrics":
+            self.sendText(200, metrics.toPrometheus(), "text/plain; version=0.0.4")
+        elif path == "/health":
+            self.sendJson(200, {"status": True})
+        else:
+            self.sendJson(404, {"status": False, "message": "Not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/recognize":
+            self.sendJson(404, {"status": False, "message": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.sendJson(400, {"status": False, "message": "Invalid Content-Length"})
+            return
+        if not 0 < length <= MAX_BODY_SIZE:
+            self.sendJson(413 if length > MAX_BODY_SIZE else 400,
+                          {"status": False, "message": "Expected an image body"})
+            return
+
+        image_bytes = self.rfile.read(length)
+        result = self.server.dispatcher.submit(image_bytes).result()
+        response = {"status": result["status"], "latency": round(result["latency"], 4)}
+        if result["status"]:
+            response["latex"] = resultToText(result)
+        else:
+            response["message"] = result.get("message", "")
+        self.sendJson(200 if result["status"] else 502, response)
+
+    def sendJson(self, code, payload):
+        self.sendText(code, json.dumps(payload, ensure_ascii=False), "application/json")
+
+    def sendText(self, code, text, contentType):
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", f"{contentType}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Serve LaTeX recognition over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("-p", "--provider", choices=sorted(SERVICES), help="override the configured API service")
+    parser.add_argument("--id", help="override the configured API id")
+    parser.add_argument("--key", help="override the configured API key")
+    parser.add_argument("--failover", action="store_true",
+                        help="hedge and fail over to the other services configured in the settings page")
+    parser.add_argument("--qps", type=quotaArg, action="append", metavar="[PROVIDER=]RATE",
+                        help="requests per second allowed by a provider's quota, the configured service's "
+                             "when no provider is named; repeat for each provider")
+    parser.add_argument("-j", "--concurrency", type=int, default=4, help="requests in flight at once (default: 4)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="config.json written by the settings page")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    useInstallResources()
+    settings = resolveApiSettings(args)
+    if settings is None:
+        return 2
+    service, access_key_id, access_key_secret = settings
+    limiters.update(loadQuotas(args, service))
+
+    fallbacks = loadFallbacks(args, service)
+    ocr_client = OCRClient(service, fallbacks=fallbacks, id=access_key_id, key=access_key_secret)
+    # connect while the server starts listening instead of on the first request, fallbacks connect when needed
+    threading.Thread(target=warmup, args=(service,), kwargs={"id": access_key_id, "key": access_key_secret},
+                     name="warmup", daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), RecognitionHandler)
+    server.daemon_threads = True
+    server.dispatcher = RecognitionDispatcher(ocr_client, max(1, args.concurrency))
+    print(f"Formulite recognition server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,22 @@
+import logging
 from typing import Union
-from cryptography.fernet import Fernet
-import os
 
-from PyQt5.QtCore import Qt, pyqtSignal, QUrl
+from PyQt5.QtCore import Qt, pyqtSignal, QUrl, QTimer
 from PyQt5.QtGui import QIcon, QColor, QDesktopServices
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QButtonGroup, QPushButton
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QButtonGroup, QPushButton, QApplication,
+                             QFileDialog, QTableWidgetItem, QHeaderView, QAbstractItemView)
 from qfluentwidgets import (ScrollArea, SettingCardGroup, OptionsSettingCard, SwitchSettingCard,
                             HyperlinkCard, PrimaryPushSettingCard, RadioButton, setTheme, setThemeColor, isDarkTheme,
                             LineEdit, PasswordLineEdit, ExpandGroupSettingCard, OptionsConfigItem,
                             Theme, ExpandLayout, ColorDialog, qconfig,
-                            ColorConfigItem, FluentIconBase, ComboBoxSettingCard, InfoBar)
+                            ColorConfigItem, FluentIconBase, ComboBoxSettingCard, InfoBar, TableWidget, PushButton)
 from qfluentwidgets import FluentIcon as FIF
 
 from config import cfg, API, EMAIL, URL, AUTHOR, VERSION, YEAR
+from credentials import credentials, InvalidToken
+from metrics import metrics
+
+log = logging.getLogger(__name__)
 
 
 class SettingInterface(ScrollArea):
@@ -62,6 +66,22 @@ class SettingInterface(ScrollArea):
             self.tr("Configure the API service for LaTeX recognition"),
             parent=self.configurationGroup
         )
+        self.failoverCard = SwitchSettingCard(
+            FIF.SYNC,
+            self.tr("Provider failover"),
+            self.tr("Also ask the other configured services when the selected one is slow or failing"),
+            configItem=cfg.apiFailover,
+            parent=self.configurationGroup
+        )
+
+        # Diagnostics group
+        self.diagnosticsGroup = SettingCardGroup(self.tr("Diagnostics"), self.scrollWidget)
+        self.diagnosticsCard = DiagnosticsSettingCard(
+            FIF.SPEED_HIGH,
+            self.tr("Recognition timings"),
+            self.tr("Where the time goes in each recognition, per stage and provider"),
+            parent=self.diagnosticsGroup
+        )
 
         # About group
         self.aboutGroup = SettingCardGroup(self.tr("About"), self.scrollWidget)
@@ -111,6 +131,8 @@ class SettingInterface(ScrollArea):
         self.personalizationGroup.addSettingCard(self.themeColorCard)
         self.personalizationGroup.addSettingCard(self.languageCard)
         self.configurationGroup.addSettingCard(self.apiConfigCard)
+        self.configurationGroup.addSettingCard(self.failoverCard)
+        self.diagnosticsGroup.addSettingCard(self.diagnosticsCard)
         self.aboutGroup.addSettingCard(self.helpCard)
         self.aboutGroup.addSettingCard(self.feedbackCard)
         self.aboutGroup.addSettingCard(self.aboutCard)
@@ -120,6 +142,7 @@ class SettingInterface(ScrollArea):
         self.expandLayout.setContentsMargins(60, 0, 60, 0)
         self.expandLayout.addWidget(self.personalizationGroup)
         self.expandLayout.addWidget(self.configurationGroup)
+        self.expandLayout.addWidget(self.diagnosticsGroup)
         self.expandLayout.addWidget(self.aboutGroup)
 
     def __showRestartTooltip(self):
@@ -175,6 +198,11 @@ class APIConfigSettingCard(ExpandGroupSettingCard):
         self.apiIdInput.setPlaceholderText("API Id")
         self.apiKeyInput.setPlaceholderText("API Key")
 
+        # typing only restarts this timer, the key is encrypted and saved once the user pauses
+        self.commitTimer = QTimer(self)
+        self.commitTimer.setSingleShot(True)
+        self.commitTimer.setInterval(500)
+
         self.__initWidget(self.configItem)
 
     def __initWidget(self, configItem: OptionsConfigItem):
@@ -193,6 +221,8 @@ class APIConfigSettingCard(ExpandGroupSettingCard):
         self.apiIdInput.textChanged.connect(self.__onApiIdTextChanged)
         self.apiKeyInput.textChanged.connect(self.__onApiKeyTextChanged)
         self.buttonGroup.buttonClicked.connect(self.__onButtonClicked)
+        self.commitTimer.timeout.connect(self.commitApiInfo)
+        QApplication.instance().aboutToQuit.connect(self.flushApiInfo)
 
     def __initLayout(self):
         self.addWidget(self.choiceLabel)
@@ -230,17 +260,46 @@ class APIConfigSettingCard(ExpandGroupSettingCard):
         if button.text() == self.choiceLabel.text():
             return
 
+        # keep the credentials of the service being left, then show the ones saved for the new service
+        self.commitApiInfo()
         value = button.property(self.configName)
         cfg.set(self.configItem, value)
         self.choiceLabel.setText(button.text())
         self.choiceLabel.adjustSize()
 
+        saved = cfg.apiCredentials.value.get(value.value, {})
+        for lineEdit, text in ((self.apiIdInput, saved.get("ID", "")),
+                               (self.apiKeyInput, decrypt_text(saved.get("Key", "")))):
+            lineEdit.blockSignals(True)
+            lineEdit.setText(text)
+            lineEdit.blockSignals(False)
+        self.commitApiInfo()
+
     def __onApiIdTextChanged(self, text: str):
-        cfg.set(cfg.apiId, text)
+        self.commitTimer.start()
 
     def __onApiKeyTextChanged(self, text: str):
-        encrypted_key = encrypt_text(text)
-        cfg.set(cfg.apiKey, encrypted_key)
+        self.commitTimer.start()
+
+    def commitApiInfo(self):
+        """ write the typed API id and key to the config in a single save """
+        self.commitTimer.stop()
+        key = encrypt_text(self.apiKeyInput.text())
+        cfg.set(cfg.apiId, self.apiIdInput.text(), save=False)
+        cfg.set(cfg.apiKey, key, save=False)
+
+        saved = dict(cfg.apiCredentials.value)
+        saved[cfg.apiService.value.value] = {"ID": self.apiIdInput.text(), "Key": key}
+        cfg.set(cfg.apiCredentials, saved, save=False)
+        cfg.save()
+
+    def flushApiInfo(self):
+        if self.commitTimer.isActive():
+            self.commitApiInfo()
+
+    def hideEvent(self, event):
+        self.flushApiInfo()
+        super().hideEvent(event)
 
     def setValue(self, value):
         """ select button according to the value """
@@ -254,6 +313,120 @@ class APIConfigSettingCard(ExpandGroupSettingCard):
                 self.choiceLabel.adjustSize()
 
 
+class DiagnosticsSettingCard(ExpandGroupSettingCard):
+    """ Stage timing histograms collected by `metrics`, refreshed while the page is shown """
+
+    STAGE, PROVIDER, COUNT, MEAN, P50, P95, P99 = range(7)
+
+    def __init__(self, icon: Union[str, QIcon, FluentIconBase], title: str, content=None, parent=None):
+        super().__init__(icon, title, content, parent=parent)
+        self.summaryLabel = QLabel(self)
+
+        self.tableWidget = QWidget(self.view)
+        self.tableLayout = QVBoxLayout(self.tableWidget)
+        self.table = TableWidget(self.tableWidget)
+
+        self.buttonLayout = QHBoxLayout()
+        self.refreshButton = PushButton(FIF.SYNC, self.tr("Refresh"), self.tableWidget)
+        self.resetButton = PushButton(FIF.DELETE, self.tr("Reset"), self.tableWidget)
+        self.exportJsonButton = PushButton(FIF.SAVE, self.tr("Export JSON"), self.tableWidget)
+        self.exportPrometheusButton = PushButton(FIF.SAVE, self.tr("Export Prometheus"), self.tableWidget)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(2000)
+
+        self.__initWidget()
+
+    def __initWidget(self):
+        self.__initLayout()
+
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(
+            [self.tr("Stage"), self.tr("Provider"), self.tr("Count"), self.tr("Mean"), "p50", "p95", "p99"])
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setFixedHeight(260)
+
+        self.refreshTimer.timeout.connect(self.refresh)
+        self.refreshButton.clicked.connect(self.refresh)
+        self.resetButton.clicked.connect(self.reset)
+        self.exportJsonButton.clicked.connect(
+            lambda: self.export(metrics.toJson(), "formulite-metrics.json", "JSON (*.json)"))
+        self.exportPrometheusButton.clicked.connect(
+            lambda: self.export(metrics.toPrometheus(), "formulite-metrics.prom", "Prometheus (*.prom *.txt)"))
+        self.refresh()
+
+    def __initLayout(self):
+        self.addWidget(self.summaryLabel)
+
+        self.buttonLayout.addWidget(self.refreshButton)
+        self.buttonLayout.addWidget(self.resetButton)
+        self.buttonLayout.addStretch(1)
+        self.buttonLayout.addWidget(self.exportJsonButton)
+        self.buttonLayout.addWidget(self.exportPrometheusButton)
+
+        self.tableLayout.setContentsMargins(48, 15, 44, 15)
+        self.tableLayout.addWidget(self.table)
+        self.tableLayout.addLayout(self.buttonLayout)
+
+        self.viewLayout.setSpacing(0)
+        self.viewLayout.setContentsMargins(0, 0, 0, 0)
+        self.addGroupWidget(self.tableWidget)
+
+    @staticmethod
+    def formatSeconds(value):
+        return "-" if value is None else f"{value * 1000:.1f} ms"
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        rows = snapshot["stages"]
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row["stage"], row["provider"], str(row["count"]), self.formatSeconds(row["mean"]),
+                      self.formatSeconds(row["p50"]), self.formatSeconds(row["p95"]), self.formatSeconds(row["p99"])]
+            for column, value in enumerate(values):
+                self.table.setItem(i, column, QTableWidgetItem(value))
+
+        total = sum(row["count"] for row in snapshot["outcomes"])
+        failed = sum(row["count"] for row in snapshot["outcomes"] if row["outcome"] == "failure")
+        self.summaryLabel.setText(self.tr("{0} recognitions, {1} failed").format(total, failed))
+        self.summaryLabel.adjustSize()
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def export(self, text, fileName, fileFilter):
+        path, _ = QFileDialog.getSaveFileName(self, self.tr("Export timings"), fileName, fileFilter)
+        if not path:
+            return
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        except OSError as e:
+            InfoBar.error(
+                title=self.tr("Export Failed"),
+                content=str(e),
+                parent=self.window()
+            ).show()
+            return
+        InfoBar.success(
+            title=self.tr("Exported"),
+            content=path,
+            parent=self.window()
+        ).show()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refreshTimer.start()
+
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        super().hideEvent(event)
+
+
 class ColorSettingCard(ExpandGroupSettingCard):
     colorChanged = pyqtSignal(QColor)
 
@@ -359,30 +532,42 @@ class ColorSettingCard(ExpandGroupSettingCard):
 
 
 def load_fernet_key():
-    key_file = 'resource/fernet_key'
-    if not os.path.exists(key_file):
-        key = Fernet.generate_key()
-        with open(key_file, 'wb') as file:
-            file.write(key)
-    else:
-        with open(key_file, 'rb') as file:
-            key = file.read()
-    return Fernet(key)
+    return credentials.getFernet()
 
 
 def encrypt_text(text):
-    if text == "":
-        return ""
-    f = load_fernet_key()
-    return f.encrypt(text.encode()).decode()
+    return credentials.encrypt(text)
 
 
 def decrypt_text(encrypted_text):
-    if encrypted_text == "":
-        return ""
-    f = load_fernet_key()
     try:
-        return f.decrypt(encrypted_text.encode()).decode()
-    except Exception as e:
-        print("Decrypt error: ", e)
+        return credentials.decrypt(encrypted_text)
+    except (InvalidToken, ValueError) as e:
+        log.warning("Cannot decrypt a saved API key: %s", e)
         return ""
+
+
+def fallbackProviders():
+    """ (service, credentials) of the other configured services when failover is on """
+    if not cfg.apiFailover.value:
+        return []
+
+    fallbacks = []
+    for api in API:
+        saved = cfg.apiCredentials.value.get(api.value, {})
+        if api == cfg.apiService.value or not saved.get("ID") or not saved.get("Key"):
+            continue
+        key = decrypt_text(saved["Key"])
+        if key:
+            fallbacks.append((f"{api}", {"id": saved["ID"], "key": key}))
+    return fallbacks
+
+
+def providerQuotas():
+    """ {service: requests per second} for the providers whose quota is set in the config """
+    quotas = {}
+    for api in API:
+        rate = cfg.apiQuotas.value.get(api.value)
+        if isinstance(rate, (int, float)) and rate > 0:
+            quotas[f"{api}"] = float(rate)
+    return quotas
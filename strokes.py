@@ -0,0 +1,94 @@
+from array import array
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+
+def clamp(value):
+    return max(INT16_MIN, min(INT16_MAX, int(value)))
+
+
+def simplify(xs, ys, epsilon):
+    """ Ramer-Douglas-Peucker: indices of the points that keep the polyline within `epsilon` """
+    count = len(xs)
+    if count < 3:
+        return list(range(count))
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        length = (dx * dx + dy * dy) ** 0.5
+
+        farthest, maxDistance = None, epsilon
+        for i in range(first + 1, last):
+            if length:
+                distance = abs(dy * (xs[i] - x0) - dx * (ys[i] - y0)) / length
+            else:
+                distance = ((xs[i] - x0) ** 2 + (ys[i] - y0) ** 2) ** 0.5
+            if distance > maxDistance:
+                farthest, maxDistance = i, distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [i for i in range(count) if keep[i]]
+
+
+class StrokeBuffer:
+    """ Strokes packed into int16 coordinate arrays plus the offset where each stroke starts """
+
+    def __init__(self, minDistance=2, epsilon=0.75):
+        self.minDistance = minDistance
+        self.epsilon = epsilon
+        self.clear()
+
+    def clear(self):
+        self.xs = array('h')
+        self.ys = array('h')
+        self.starts = array('I')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def pointCount(self):
+        return len(self.xs)
+
+    def startStroke(self, x, y):
+        self.starts.append(len(self.xs))
+        self.xs.append(clamp(x))
+        self.ys.append(clamp(y))
+
+    def addPoint(self, x, y):
+        """ append a point to the current stroke, False when it is too close to the last kept one """
+        x, y = clamp(x), clamp(y)
+        if abs(x - self.xs[-1]) + abs(y - self.ys[-1]) < self.minDistance:
+            return False
+        self.xs.append(x)
+        self.ys.append(y)
+        return True
+
+    def endStroke(self):
+        """ simplify the finished stroke so storage follows its shape, not the polling rate """
+        if not self.starts:
+            return
+        start = self.starts[-1]
+        xs, ys = self.xs[start:], self.ys[start:]
+        indices = simplify(xs, ys, self.epsilon)
+        if len(indices) < len(xs):
+            del self.xs[start:]
+            del self.ys[start:]
+            self.xs.extend(xs[i] for i in indices)
+            self.ys.extend(ys[i] for i in indices)
+
+    def stroke(self, index):
+        start = self.starts[index]
+        end = self.starts[index + 1] if index + 1 < len(self.starts) else len(self.xs)
+        return self.xs[start:end], self.ys[start:end]
+
+    def strokes(self):
+        for index in range(len(self.starts)):
+            yield self.stroke(index)
@@ -0,0 +1,59 @@
+import csv
+import os
+
+import pytest
+
+from batch import collectImages, exportResults
+
+
+@pytest.fixture
+def images(tmp_path):
+    for name in ["b.png", "a.JPG", "notes.txt", "sub/z.png", "sub/c.bmp", "sub/deeper/d.jpeg", "other/e.png"]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+    return tmp_path
+
+
+def relative(paths, root):
+    return [os.path.relpath(path, root).replace(os.sep, "/") for path in paths]
+
+
+def test_folders_are_walked_in_name_order_and_skip_other_files(images):
+    assert relative(collectImages([str(images)]), images) == [
+        "a.JPG", "b.png", "other/e.png", "sub/c.bmp", "sub/z.png", "sub/deeper/d.jpeg"]
+
+
+def test_files_keep_the_order_they_are_given_in(images):
+    paths = [str(images / "sub" / "z.png"), str(images / "b.png")]
+    assert relative(collectImages(paths), images) == ["sub/z.png", "b.png"]
+
+
+def test_missing_and_non_image_files_are_skipped(images):
+    assert collectImages([str(images / "notes.txt"), str(images / "missing.png")]) == []
+
+
+def test_glob_patterns_are_expanded(images):
+    assert relative(collectImages([str(images / "**" / "*.png")]), images) == [
+        "b.png", "other/e.png", "sub/z.png"]
+
+
+def test_paths_are_collected_once(images):
+    paths = [str(images / "b.png"), str(images / "." / "b.png"), str(images / "*.png"), str(images)]
+    result = relative(collectImages(paths), images)
+    assert result[0] == "b.png"
+    assert len(result) == len(set(result)) == 6
+
+
+def test_export_tex(tmp_path):
+    path = tmp_path / "results.tex"
+    exportResults([("a.png", "x^2"), ("b.png", r"\frac{1}{2}")], str(path))
+    assert path.read_text(encoding="utf-8") == "% a.png\n\\[\nx^2\n\\]\n\n% b.png\n\\[\n\\frac{1}{2}\n\\]\n\n"
+
+
+def test_export_csv_quotes_latex(tmp_path):
+    path = tmp_path / "results.CSV"
+    entries = [("a.png", "x, y"), ("b.png", 'a "quote"\nnext line')]
+    exportResults(entries, str(path))
+    with open(path, encoding="utf-8", newline="") as f:
+        assert list(csv.reader(f)) == [["file", "latex"], ["a.png", "x, y"], ["b.png", 'a "quote"\nnext line']]
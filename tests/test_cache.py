@@ -0,0 +1,129 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+
+from cache import ResultCache, imageHash, normalizeImageBytes
+
+
+def chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png(*extra):
+    header = chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+    pixels = chunk(b"IDAT", zlib.compress(b"\x00\xff"))
+    return b"\x89PNG\r\n\x1a\n" + header + b"".join(extra) + pixels + chunk(b"IEND", b"")
+
+
+def result(latex):
+    return {"status": True, "result": [latex]}
+
+
+def fileSize(cache, key):
+    return os.path.getsize(cache._path(key))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path), maxEntries=2)
+
+
+def test_metadata_does_not_change_the_key():
+    plain, tagged = png(), png(chunk(b"tEXt", b"Software\x00screenshot tool"))
+    assert normalizeImageBytes(tagged) == plain
+    assert imageHash(plain) == imageHash(tagged)
+    assert ResultCache.makeKey(plain, 'API.SIMPLETEX') == ResultCache.makeKey(tagged, 'API.SIMPLETEX')
+    assert ResultCache.makeKey(plain, 'API.SIMPLETEX') != ResultCache.makeKey(plain, 'API.ALIYUN')
+
+
+def test_memory_tier_evicts_the_least_recently_used(cache):
+    cache.put("a", result("a"))
+    cache.put("b", result("b"))
+    cache.get("a")
+    cache.put("c", result("c"))
+    assert list(cache.memory) == ["a", "c"]
+
+    # still on disk
+    assert cache.get("b") == result("b")
+    assert cache.stats()["diskHits"] == 1
+    assert list(cache.memory) == ["c", "b"]
+
+
+def test_miss_is_counted(cache):
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 0, "diskHits": 0, "misses": 1, "hitRate": 0.0, "entries": 0}
+
+
+def test_results_are_copies(cache):
+    cache.put("a", result("x"))
+    cache.get("a")["result"].append("changed")
+    assert cache.get("a") == result("x")
+
+
+def test_disk_bytes_follow_the_files(cache):
+    cache.put("a", result("short"))
+    assert cache.diskBytes == fileSize(cache, "a")
+
+    cache.put("b", result("b"))
+    cache.put("a", result("a much longer formula than before"))
+    assert cache.diskBytes == fileSize(cache, "a") + fileSize(cache, "b")
+
+    cache.put("a", result("x"))
+    assert cache.diskBytes == fileSize(cache, "a") + fileSize(cache, "b")
+
+
+def test_prune_keeps_the_newest_entries_in_half_the_budget(tmp_path):
+    cache = ResultCache(str(tmp_path), maxDiskBytes=200)
+    for i in range(10):
+        cache.put(f"key{i}", result(f"formula {i}"))
+        os.utime(cache._path(f"key{i}"), (1000 + i, 1000 + i))
+    cache.put("last", result("last"))
+
+    remaining = sorted(name for name in os.listdir(tmp_path) if name.endswith(".json"))
+    assert "last.json" in remaining and "key0.json" not in remaining
+    assert cache.diskBytes == sum(os.path.getsize(tmp_path / name) for name in remaining) <= 200
+
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = ResultCache(str(tmp_path), maxAge=60)
+    cache.put("a", result("a"))
+    cache.memory.clear()
+    old = time.time() - 120
+    os.utime(cache._path("a"), (old, old))
+    assert cache.get("a") is None
+    assert not os.path.exists(cache._path("a"))
+
+
+def test_clear_empties_both_tiers(cache):
+    cache.put("a", result("a"))
+    cache.clear()
+    assert cache.get("a") is None
+    assert not any(name.endswith(".json") for name in os.listdir(cache.directory))
+
+
+def test_expired_entries_leave_the_byte_count(tmp_path):
+    cache = ResultCache(str(tmp_path), maxAge=60)
+    cache.put("a", result("a"))
+    cache.put("b", result("b"))
+    cache.memory.clear()
+    old = time.time() - 120
+    os.utime(cache._path("a"), (old, old))
+    assert cache.get("a") is None
+    assert cache.diskBytes == fileSize(cache, "b")
+
+
+def test_concurrent_writes_of_one_key_use_their_own_files(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    threads = [threading.Thread(target=cache.put, args=("a", result("x" * i))) for i in range(1, 17)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert os.listdir(tmp_path) == ["a.json"]
+    assert cache._readDisk("a")["result"][0] == "x" * len(cache._readDisk("a")["result"][0])
+    assert cache.diskBytes == fileSize(cache, "a")
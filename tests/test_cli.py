@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import cli
+from credentials import CredentialStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = CredentialStore(str(tmp_path / "fernet_key"))
+    monkeypatch.setattr(cli, "credentials", store)
+    return store
+
+
+@pytest.fixture
+def config(tmp_path, store):
+    def write(**api):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps({"API": api}), encoding="utf-8")
+        return str(path)
+    return write
+
+
+def parse(config, *argv):
+    return cli.parseArgs(["--config", config, *argv, "x.png"])
+
+
+def test_saved_settings_are_decrypted(config, store):
+    path = config(Service="SimpleTex", ID="id", Key=store.encrypt("secret"))
+    assert cli.resolveApiSettings(parse(path)) == ('API.SIMPLETEX', "id", "secret")
+
+
+def test_command_line_overrides_the_saved_settings(config, store):
+    path = config(Service="SimpleTex", ID="id", Key=store.encrypt("secret"))
+    args = parse(path, "--provider", "aliyun", "--id", "other", "--key", "typed")
+    assert cli.resolveApiSettings(args) == ('API.ALIYUN', "other", "typed")
+
+
+@pytest.mark.parametrize("api", [
+    {},
+    {"Service": "Nowhere", "ID": "id", "Key": ""},
+    {"Service": "Aliyun", "ID": "", "Key": ""},
+    {"Service": "Aliyun", "ID": "id", "Key": "not a token"},
+])
+def test_incomplete_settings_are_reported(config, capsys, api):
+    assert cli.resolveApiSettings(parse(config(**api))) is None
+    assert "error:" in capsys.readouterr().err
+
+
+def test_unreadable_config_is_treated_as_empty(tmp_path, capsys):
+    path = tmp_path / "config.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert cli.resolveApiSettings(parse(str(path), "--provider", "aliyun", "--id", "i", "--key", "k")) == \
+        ('API.ALIYUN', "i", "k")
+    assert cli.resolveApiSettings(parse(str(tmp_path / "missing.json"))) is None
+
+
+def credentials(store):
+    return {
+        "SimpleTex": {"ID": "s", "Key": store.encrypt("simpletex key")},
+        "TencentCloud": {"ID": "t", "Key": store.encrypt("tencent key")},
+        "Aliyun": {"ID": "a", "Key": ""},
+        "Unknown": {"ID": "u", "Key": store.encrypt("unknown key")},
+    }
+
+
+def test_fallbacks_are_the_other_complete_credentials(config, store):
+    path = config(Failover=True, Credentials=credentials(store))
+    assert cli.loadFallbacks(parse(path), 'API.SIMPLETEX') == [
+        ('API.TENCENTCLOUD', {"id": "t", "key": "tencent key"})]
+    assert cli.loadFallbacks(parse(path), 'API.ALIYUN') == [
+        ('API.SIMPLETEX', {"id": "s", "key": "simpletex key"}),
+        ('API.TENCENTCLOUD', {"id": "t", "key": "tencent key"})]
+
+
+def test_fallbacks_need_failover_in_the_settings_or_on_the_command_line(config, store):
+    path = config(Failover=False, Credentials=credentials(store))
+    assert cli.loadFallbacks(parse(path), 'API.SIMPLETEX') == []
+    assert [service for service, _ in cli.loadFallbacks(parse(path, "--failover"), 'API.SIMPLETEX')] == [
+        'API.TENCENTCLOUD']
+
+
+def test_fallback_keys_made_with_another_key_file_are_skipped(config, store, tmp_path):
+    other = CredentialStore(str(tmp_path / "other_key"))
+    path = config(Failover=True, Credentials={"Aliyun": {"ID": "a", "Key": other.encrypt("secret")}})
+    assert cli.loadFallbacks(parse(path), 'API.SIMPLETEX') == []
+
+
+@pytest.mark.parametrize("value", ["0", "-3", "2.5", "many"])
+def test_positive_int_rejects_other_values(value):
+    with pytest.raises(cli.argparse.ArgumentTypeError):
+        cli.positiveInt(value)
+
+
+def test_positive_int():
+    assert cli.positiveInt("12") == 12
@@ -0,0 +1,85 @@
+import pytest
+
+from history_store import HistoryStore, ftsQuery
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flushInterval=0.01)
+    yield store
+    store.close()
+
+
+def addAll(store, formulas):
+    for i, latex in enumerate(formulas):
+        store.add("SimpleTex", latex, timestamp=1000 + i)
+    store.flush()
+
+
+def test_fts_query_quotes_every_token():
+    assert ftsQuery(r'\frac x"y') == r'"\frac"* "x""y"*'
+    assert ftsQuery("   ") == ""
+
+
+def test_search_matches_commands_as_words(store):
+    addAll(store, [r"\frac{a}{b}", r"\sqrt{x}", r"\int_0^1 \frac{1}{x} dx", "e^{i\\pi} + 1 = 0"])
+    assert [row[4] for row in store.search(r"\frac")] == [r"\int_0^1 \frac{1}{x} dx", r"\frac{a}{b}"]
+    assert [row[4] for row in store.search(r"\sq")] == [r"\sqrt{x}"]
+    assert store.count(r"\frac") == 2
+    assert store.count() == 4
+
+
+def test_search_returns_newest_first(store):
+    addAll(store, ["a", "b", "c"])
+    rows = store.search()
+    assert [row[4] for row in rows] == ["c", "b", "a"]
+    assert [row[1] for row in rows] == [1002, 1001, 1000]
+
+
+def test_keyset_pages_cover_every_record_once(store):
+    addAll(store, [f"x_{{{i}}}" for i in range(25)])
+    pages, beforeId = [], None
+    while True:
+        page = store.search("", 10, beforeId)
+        if not page:
+            break
+        pages.append(page)
+        beforeId = page[-1][0]
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ids = [row[0] for page in pages for row in page]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 25
+
+
+def test_keyset_pages_of_a_search(store):
+    addAll(store, [r"\alpha" if i % 2 else r"\beta" for i in range(12)])
+    first = store.search(r"\alpha", 4)
+    second = store.search(r"\alpha", 4, first[-1][0])
+    assert len(first) == 4 and len(second) == 2
+    assert all(row[4] == r"\alpha" for row in first + second)
+
+
+def test_deleted_records_leave_the_index(store):
+    addAll(store, [r"\frac{1}{2}", r"\frac{3}{4}"])
+    newest = store.search(r"\frac")[0]
+    store.delete(newest[0])
+    assert [row[4] for row in store.search(r"\frac")] == [r"\frac{1}{2}"]
+
+
+def test_unopenable_database_does_not_block_flush(tmp_path):
+    store = HistoryStore(str(tmp_path / "missing" / "history.db"))
+    store.add("SimpleTex", "x")
+    store.flush()
+    assert store.writer is None
+
+
+
+def test_images_live_as_long_as_their_records(store):
+    store.add("SimpleTex", "a", image_hash="h", image=b"png")
+    store.add("SimpleTex", "b", image_hash="h", image=b"png")
+    store.flush()
+    first, second = store.search()
+    store.delete(first[0])
+    assert store.image("h") == b"png"
+    store.delete(second[0])
+    assert store.image("h") is None
@@ -0,0 +1,81 @@
+import pytest
+
+from metrics import BUCKETS, Histogram, Metrics
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 1, 3):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(4.65)
+
+
+def test_histogram_quantile_interpolates_inside_the_bucket():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) is None
+    for _ in range(10):
+        histogram.observe(0.003)
+    assert histogram.quantile(0.5) == pytest.approx(0.00375)
+    assert histogram.quantile(1.0) == pytest.approx(0.005)
+
+
+def test_histogram_quantile_in_the_overflow_bucket():
+    histogram = Histogram(buckets=(1,))
+    histogram.observe(100)
+    assert histogram.quantile(0.99) == 1
+
+
+def test_summary_labels_every_bucket():
+    summary = Histogram().summary()
+    assert list(summary["buckets"]) == [str(bound) for bound in BUCKETS] + ["+Inf"]
+    assert summary["mean"] is None
+
+
+def test_timer_records_even_when_the_stage_fails():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with metrics.timer("network", "SimpleTex"):
+            raise ValueError()
+    assert metrics.histograms[("network", "SimpleTex")].count == 1
+
+
+def test_snapshot_orders_rows_by_pipeline_stage():
+    metrics = Metrics()
+    metrics.observe("total", "SimpleTex", 1)
+    metrics.observe("encode", "SimpleTex", 0.01)
+    metrics.observe("network", "Aliyun", 0.5)
+    metrics.observe("network", "SimpleTex", 0.5)
+    rows = [(row["stage"], row["provider"]) for row in metrics.snapshot()["stages"]]
+    assert rows == [("encode", "SimpleTex"), ("network", "Aliyun"), ("network", "SimpleTex"), ("total", "SimpleTex")]
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = Metrics()
+    for value in (0.002, 0.02, 0.2, 50):
+        metrics.observe("network", "Aliyun", value)
+    metrics.countOutcome("Aliyun", True)
+    metrics.countOutcome("Aliyun", False)
+    metrics.countOutcome("Aliyun", True)
+
+    lines = metrics.toPrometheus().splitlines()
+    assert "# TYPE formulite_stage_seconds histogram" in lines
+    labels = 'stage="network",provider="Aliyun"'
+    assert f'formulite_stage_seconds_bucket{{{labels},le="0.001"}} 0' in lines
+    assert f'formulite_stage_seconds_bucket{{{labels},le="0.0025"}} 1' in lines
+    assert f'formulite_stage_seconds_bucket{{{labels},le="0.025"}} 2' in lines
+    assert f'formulite_stage_seconds_bucket{{{labels},le="30"}} 3' in lines
+    assert f'formulite_stage_seconds_bucket{{{labels},le="+Inf"}} 4' in lines
+    assert f'formulite_stage_seconds_count{{{labels}}} 4' in lines
+    assert any(line.startswith(f'formulite_stage_seconds_sum{{{labels}}} 50.222') for line in lines)
+    assert 'formulite_recognitions_total{provider="Aliyun",outcome="success"} 2' in lines
+    assert 'formulite_recognitions_total{provider="Aliyun",outcome="failure"} 1' in lines
+
+
+def test_reset_forgets_everything():
+    metrics = Metrics()
+    metrics.observe("total", "SimpleTex", 1)
+    metrics.countOutcome("SimpleTex", True)
+    metrics.reset()
+    assert metrics.snapshot()["stages"] == [] and metrics.snapshot()["outcomes"] == []
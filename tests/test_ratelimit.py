@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+
+import ratelimit
+from ratelimit import LimiterRegistry, TokenBucket, backoffDelay, parseRetryAfter, retryDelay
+
+
+class Clock:
+    """ stands in for the `time` module so the bucket refills only when a test says so """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_spaces_requests(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=4, burst=1)
+    assert bucket.reserve() == 0
+    clock.now += 0.25
+    assert bucket.reserve() == 0
+    clock.now += 0.125
+    assert bucket.reserve() == pytest.approx(0.125)
+
+
+def test_bucket_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=10, burst=3)
+    clock.now += 3600
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1)
+
+
+def test_default_burst_follows_the_rate(clock):
+    assert TokenBucket(rate=0.5).burst == 1
+    assert TokenBucket(rate=8).burst == 8
+
+
+def test_acquire_sleeps_for_the_reservation(clock):
+    bucket = TokenBucket(rate=2, burst=1)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_acquire_stops_when_cancelled(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.reserve()
+    cancelled = threading.Event()
+    cancelled.set()
+    assert bucket.acquire(cancelled) is False
+    assert clock.slept == []
+
+
+def test_drain_spends_the_burst(clock):
+    bucket = TokenBucket(rate=5, burst=5)
+    bucket.drain()
+    assert bucket.reserve() == pytest.approx(0.2)
+
+
+def test_registry_shares_one_bucket_per_provider(clock):
+    limiters = LimiterRegistry({'API.SIMPLETEX': 2})
+    assert limiters.get('API.SIMPLETEX') is limiters.get('API.SIMPLETEX')
+    assert limiters.get('API.SIMPLETEX').rate == 2
+    assert limiters.get('API.OTHER').rate == 5
+
+    limiters.configure('API.SIMPLETEX', 20)
+    assert limiters.get('API.SIMPLETEX').rate == 20
+
+
+def test_backoff_stays_within_the_exponential_bound(monkeypatch):
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: high)
+    assert [backoffDelay(attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+    assert backoffDelay(3, baseDelay=1, maxDelay=5) == 5
+
+
+def test_backoff_is_jittered_from_zero():
+    delays = [backoffDelay(2) for _ in range(200)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert min(delays) < 1.0 < max(delays)
+
+
+def test_parse_retry_after(clock):
+    assert parseRetryAfter("3") == 3.0
+    assert parseRetryAfter("-1") == 0.0
+    assert parseRetryAfter(None) is None
+    assert parseRetryAfter("soon") is None
+    clock.now = 1445412480.0  # Wed, 21 Oct 2015 07:28:00 GMT
+    assert parseRetryAfter("Wed, 21 Oct 2015 07:28:30 GMT") == pytest.approx(30)
+
+
+def test_retry_delay_prefers_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit.random, "uniform", lambda low, high: high)
+    assert retryDelay(2) == 2.0
+    assert retryDelay(2, retryAfter=4) == 4.5
+    assert retryDelay(0, retryAfter=120) is None
+
+
+def test_registry_update_keeps_buckets_whose_rate_is_unchanged(clock):
+    limiters = LimiterRegistry({'API.SIMPLETEX': 2, 'API.ALIYUN': 10})
+    simpletex = limiters.get('API.SIMPLETEX')
+    aliyun = limiters.get('API.ALIYUN')
+
+    limiters.update({'API.SIMPLETEX': 2, 'API.ALIYUN': 20, 'API.TENCENTCLOUD': 15})
+    assert limiters.get('API.SIMPLETEX') is simpletex
+    assert limiters.get('API.ALIYUN') is not aliyun
+    assert limiters.get('API.ALIYUN').rate == 20
+    assert limiters.get('API.TENCENTCLOUD').rate == 15
+
+
+def test_cli_quotas_come_from_the_config_and_the_command_line(tmp_path):
+    cli = pytest.importorskip("cli")
+    config = tmp_path / "config.json"
+    config.write_text('{"API": {"Quotas": {"SimpleTex": 4, "Aliyun": 0, "Unknown": 3, "TencentCloud": "fast"}}}',
+                      encoding='utf-8')
+
+    args = cli.parseArgs(["--config", str(config), "--qps", "7", "--qps", "tencentcloud=30", "x.png"])
+    assert cli.loadQuotas(args, 'API.ALIYUN') == {'API.SIMPLETEX': 4.0, 'API.ALIYUN': 7.0, 'API.TENCENTCLOUD': 30.0}
+
+    args = cli.parseArgs(["--config", str(config), "x.png"])
+    assert cli.loadQuotas(args, 'API.ALIYUN') == {'API.SIMPLETEX': 4.0}
+
+
+@pytest.mark.parametrize("value", ["0", "fast", "nowhere=3", "=3", "aliyun=-1"])
+def test_cli_rejects_bad_quotas(value):
+    cli = pytest.importorskip("cli")
+    with pytest.raises(SystemExit):
+        cli.parseArgs(["--qps", value, "x.png"])
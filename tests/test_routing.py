@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+import routing
+from cache import ResultCache
+from ocr_services import CachedService, RateLimitedService, RecognitionService
+from routing import HedgedRouter, ProviderHealth
+
+
+class FakeService(RecognitionService):
+    """ answers `result` after `delay` seconds, or once `release` is set """
+
+    def __init__(self, result=None, delay=0, release=None):
+        self.result = result or {"status": True, "result": ["x"]}
+        self.delay = delay
+        self.release = release
+        self.calls = 0
+
+    def recognizeFormula(self, image_data):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        return dict(self.result)
+
+
+class QueuedService(RateLimitedService):
+    """ waits `queued` seconds for a rate-limit token before the request goes out """
+
+    def __init__(self, service, queued):
+        super().__init__(service, "fake")
+        self.queued = queued
+
+    def recognizeFormula(self, image_data, started=None, cancelled=None):
+        time.sleep(self.queued)
+        started()
+        return self.service.recognizeFormula(image_data)
+
+
+@pytest.fixture(autouse=True)
+def health(monkeypatch):
+    # what one test teaches the router about a provider must not leak into the next
+    providerHealth = {}
+    monkeypatch.setattr(routing, "providerHealth", providerHealth)
+    return providerHealth
+
+
+def answer(latex):
+    return {"status": True, "result": [latex]}
+
+
+def test_primary_answer_is_tagged_with_its_service():
+    primary, fallback = FakeService(answer("a")), FakeService(answer("b"))
+    router = HedgedRouter([("primary", primary), ("fallback", fallback)])
+    assert router.recognizeFormula(b"img") == {"status": True, "result": ["a"], "service": "primary"}
+    assert fallback.calls == 0
+
+
+def test_slow_primary_is_hedged_after_the_delay():
+    release = threading.Event()
+    primary, fallback = FakeService(answer("a"), release=release), FakeService(answer("b"))
+    router = HedgedRouter([("primary", primary), ("fallback", fallback)], defaultDelay=0.1)
+    start = time.monotonic()
+    try:
+        result = router.recognizeFormula(b"img")
+    finally:
+        release.set()
+    assert result["service"] == "fallback"
+    assert 0.1 <= time.monotonic() - start < 1
+
+
+def test_failure_fails_over_without_waiting_for_the_hedge():
+    primary = FakeService({"status": False, "message": "boom"})
+    fallback = FakeService(answer("b"))
+    router = HedgedRouter([("primary", primary), ("fallback", fallback)], defaultDelay=5)
+    start = time.monotonic()
+    assert router.recognizeFormula(b"img")["service"] == "fallback"
+    assert time.monotonic() - start < 1
+
+
+def test_last_failure_is_returned_when_every_provider_fails():
+    router = HedgedRouter([("primary", FakeService({"status": False, "message": "first"})),
+                           ("fallback", FakeService({"status": False, "message": "second"}))])
+    assert router.recognizeFormula(b"img") == {"status": False, "message": "second", "service": "fallback"}
+
+
+def test_waiting_for_a_rate_limit_token_does_not_count_towards_the_hedge():
+    primary = QueuedService(FakeService(answer("a")), queued=0.3)
+    fallback = FakeService(answer("b"))
+    router = HedgedRouter([("primary", primary), ("fallback", fallback)], defaultDelay=0.1, minDelay=0.1)
+    assert router.recognizeFormula(b"img")["service"] == "primary"
+    assert fallback.calls == 0
+
+
+def test_cancelling_returns_without_waiting_for_the_providers():
+    release = threading.Event()
+    router = HedgedRouter([("primary", FakeService(release=release))], defaultDelay=5)
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    start = time.monotonic()
+    try:
+        assert router.recognizeFormula(b"img", cancelled=cancelled) == {"status": False, "message": "Cancelled"}
+    finally:
+        release.set()
+    assert time.monotonic() - start < 1
+
+
+def test_unhealthy_providers_are_tried_last(health):
+    health["primary"] = ProviderHealth(maxFailures=1)
+    health["primary"].record(False, 0)
+    primary, fallback = FakeService(answer("a")), FakeService(answer("b"))
+    router = HedgedRouter([("primary", primary), ("fallback", fallback)])
+    assert router.recognizeFormula(b"img")["service"] == "fallback"
+    assert primary.calls == 0
+
+
+def test_hedge_delay_follows_the_latency_percentile(health):
+    router = HedgedRouter([], percentile=0.9, defaultDelay=2.0, minDelay=0.3)
+    assert router.hedgeDelay("primary") == 2.0
+    for latency in range(1, 11):
+        health.setdefault("primary", ProviderHealth()).record(True, latency / 10)
+    assert router.hedgeDelay("primary") == 1.0
+    health["fast"] = ProviderHealth()
+    for _ in range(10):
+        health["fast"].record(True, 0.01)
+    assert router.hedgeDelay("fast") == 0.3
+
+
+def test_cached_service_keeps_a_fallback_answer_under_the_fallback(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    primary = FakeService({"status": False, "message": "boom"})
+    router = HedgedRouter([("primary", primary), ("fallback", FakeService(answer("b")))])
+    service = CachedService(router, "primary", cache)
+
+    assert service.recognizeFormula(b"img")["service"] == "fallback"
+    assert cache.get(ResultCache.makeKey(b"img", "fallback"))["result"] == ["b"]
+    assert cache.get(ResultCache.makeKey(b"img", "primary")) is None
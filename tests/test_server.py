@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from server import RecognitionDispatcher
+
+
+class FakeClient:
+    """ answers once `release` is set, or straight away without one """
+
+    service = 'API.SIMPLETEX'
+
+    def __init__(self, release=None, fail=False):
+        self.release = release
+        self.fail = fail
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def recognizeText(self, image_bytes):
+        with self.lock:
+            self.calls.append(image_bytes)
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("boom")
+        return {"status": True, "latex": image_bytes.decode()}
+
+
+@pytest.fixture
+def release():
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_identical_images_in_flight_share_one_call(release):
+    client = FakeClient(release)
+    dispatcher = RecognitionDispatcher(client, maxWorkers=2)
+    futures = [dispatcher.submit(b"same") for _ in range(5)]
+    assert all(future is futures[0] for future in futures)
+
+    release.set()
+    assert futures[0].result(5)["latex"] == "same"
+    assert client.calls == [b"same"]
+    stats = dispatcher.stats()
+    assert (stats["requests"], stats["deduplicated"], stats["dispatched"]) == (5, 4, 1)
+    assert stats["inFlight"] == 0
+
+
+def test_different_images_are_dispatched_separately(release):
+    client = FakeClient(release)
+    dispatcher = RecognitionDispatcher(client, maxWorkers=1)
+    first, second = dispatcher.submit(b"a"), dispatcher.submit(b"b")
+    assert first is not second
+    assert dispatcher.stats()["inFlight"] == 2
+
+    release.set()
+    assert (first.result(5)["latex"], second.result(5)["latex"]) == ("a", "b")
+    assert sorted(client.calls) == [b"a", b"b"]
+
+
+def test_a_finished_image_is_sent_again():
+    client = FakeClient()
+    dispatcher = RecognitionDispatcher(client)
+    dispatcher.submit(b"same").result(5)
+    dispatcher.submit(b"same").result(5)
+    # the provider client's result cache answers repeats, the dispatcher only shares work still running
+    assert client.calls == [b"same", b"same"]
+    assert dispatcher.stats()["deduplicated"] == 0
+
+
+def test_queue_depth_counts_requests_waiting_for_a_worker(release):
+    dispatcher = RecognitionDispatcher(FakeClient(release), maxWorkers=1)
+    futures = [dispatcher.submit(bytes([i])) for i in range(3)]
+    for _ in range(100):
+        if dispatcher.stats()["queueDepth"] == 2:
+            break
+        release.wait(0.01)
+    assert dispatcher.stats()["queueDepth"] == 2
+
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert dispatcher.stats()["queueDepth"] == 0
+
+
+def test_errors_are_answered_and_counted():
+    dispatcher = RecognitionDispatcher(FakeClient(fail=True))
+    result = dispatcher.submit(b"x").result(5)
+    assert result["status"] is False and result["message"] == "boom"
+    assert "latency" in result
+    stats = dispatcher.stats()
+    assert stats["failed"] == 1 and stats["latency"]["samples"] == 1
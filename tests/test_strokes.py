@@ -0,0 +1,72 @@
+from strokes import INT16_MAX, INT16_MIN, StrokeBuffer, simplify
+
+
+def test_simplify_keeps_short_polylines():
+    assert simplify([0, 5], [0, 5], 0.75) == [0, 1]
+    assert simplify([], [], 0.75) == []
+
+
+def test_simplify_drops_collinear_points():
+    xs = list(range(10))
+    assert simplify(xs, [0] * 10, 0.75) == [0, 9]
+
+
+def test_simplify_keeps_corners():
+    xs = [0, 1, 2, 3, 3, 3, 3]
+    ys = [0, 0, 0, 0, 1, 2, 3]
+    assert simplify(xs, ys, 0.75) == [0, 3, 6]
+
+
+def test_simplify_respects_epsilon():
+    xs, ys = [0, 5, 10], [0, 0.5, 0]
+    assert simplify(xs, ys, 0.75) == [0, 2]
+    assert simplify(xs, ys, 0.25) == [0, 1, 2]
+
+
+def test_simplify_closed_stroke():
+    # first and last point coincide, distances are measured from that point
+    xs, ys = [0, 10, 0], [0, 0, 0]
+    assert simplify(xs, ys, 0.75) == [0, 1, 2]
+
+
+def test_buffer_packs_coordinates_as_int16():
+    buffer = StrokeBuffer()
+    buffer.startStroke(40000, -40000)
+    buffer.addPoint(10.7, 3.2)
+    assert buffer.xs.typecode == 'h' and buffer.ys.typecode == 'h'
+    assert list(buffer.xs) == [INT16_MAX, 10]
+    assert list(buffer.ys) == [INT16_MIN, 3]
+
+
+def test_buffer_skips_points_closer_than_min_distance():
+    buffer = StrokeBuffer(minDistance=2)
+    buffer.startStroke(0, 0)
+    assert not buffer.addPoint(1, 0)
+    assert buffer.addPoint(1, 1)
+    assert buffer.pointCount() == 2
+
+
+def test_buffer_simplifies_finished_strokes():
+    buffer = StrokeBuffer(minDistance=1)
+    buffer.startStroke(0, 0)
+    for x in range(1, 20):
+        buffer.addPoint(x, 0)
+    buffer.endStroke()
+    assert list(buffer.xs) == [0, 19]
+
+
+def test_buffer_strokes_are_separate_slices():
+    buffer = StrokeBuffer(minDistance=1)
+    buffer.startStroke(0, 0)
+    buffer.addPoint(5, 5)
+    buffer.endStroke()
+    buffer.startStroke(100, 100)
+    buffer.addPoint(100, 120)
+    buffer.endStroke()
+
+    assert len(buffer) == 2
+    assert list(buffer.starts) == [0, 2]
+    assert [(list(xs), list(ys)) for xs, ys in buffer.strokes()] == [([0, 5], [0, 5]), ([100, 100], [100, 120])]
+
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.pointCount() == 0